@@ -0,0 +1,86 @@
+# Benchmark: gateway CPU use against background CAN load, with and without kernel acceptance filters
+# Needs a SocketCAN interface, e.g.:
+#   sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+#   python bench_can_filters.py --rate 5000 --duration 10
+import argparse
+import multiprocessing
+import threading
+import time
+import can
+from gateway import Gateway
+from routing import load_routes
+
+ROUTED_RATE = 10.0   # Routed frames per second, like the temperature sender
+BATCH_PERIOD = 0.001  # Seconds between two bursts of background frames
+
+def generate_load(channel, rate, routed_ids, duration, stop):
+    """Send `rate` unrouted frames per second plus ROUTED_RATE routed ones until stop is set"""
+    bus = can.interface.Bus(channel=channel, interface="socketcan")
+    background = [i for i in range(0x100, 0x700) if i not in routed_ids]
+    routed = sorted(routed_ids)
+    sent = 0
+    next_routed = 0.0
+    start = time.perf_counter()
+    try:
+        while not stop.is_set() and time.perf_counter() - start < duration:
+            elapsed = time.perf_counter() - start
+            # Catch up to the target rate in bursts, sleeping between them
+            while sent < rate * elapsed:
+                bus.send(can.Message(arbitration_id=background[sent % len(background)], data=b"\x00" * 8,
+                                     is_extended_id=False))
+                sent += 1
+            if routed and elapsed >= next_routed:
+                bus.send(can.Message(arbitration_id=routed[0], data=b"\x42", is_extended_id=False))
+                next_routed += 1.0 / ROUTED_RATE
+            time.sleep(BATCH_PERIOD)
+    except can.CanError as e:
+        print(f"Load generator stopped: {e}")
+    finally:
+        bus.shutdown()
+
+def run_gateway(channel, duration, can_filters, results):
+    """Run the gateway for duration seconds and report its CPU time and forwarded frames"""
+    routes = load_routes()
+    forwarded = [0]
+    bus = can.interface.Bus(channel=channel, interface="socketcan")
+    gateway = Gateway(bus, on_can_received=lambda message_id, data: forwarded.__setitem__(0, forwarded[0] + 1),
+                      listen_port=0, server=("127.0.0.1", 9), routes=routes, can_filters=can_filters)
+    timer = threading.Timer(duration, gateway.stop)
+    cpu_start = time.process_time()
+    timer.start()
+    gateway.run()
+    cpu = time.process_time() - cpu_start
+    bus.shutdown()
+    results.put((cpu, forwarded[0], routes.unrouted_can))
+
+def measure(channel, rate, duration, can_filters):
+    routes = load_routes()
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    gateway = multiprocessing.Process(target=run_gateway, args=(channel, duration, can_filters, results))
+    load = multiprocessing.Process(target=generate_load, args=(channel, rate, set(routes.can), duration, stop))
+    gateway.start()
+    time.sleep(0.5)  # Let the gateway install its filters first
+    load.start()
+    cpu, forwarded, unrouted = results.get()
+    stop.set()
+    load.join()
+    gateway.join()
+    return cpu, forwarded, unrouted
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway CPU use with and without kernel CAN filters")
+    parser.add_argument("--channel", default="vcan0", help="SocketCAN interface")
+    parser.add_argument("--rate", type=float, default=5000.0, help="Background frames per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds measured per run")
+    args = parser.parse_args()
+
+    print(f"{args.rate:.0f} background frames/s on {args.channel}, {args.duration:.0f} s per run")
+    for can_filters in (False, True):
+        cpu, forwarded, unrouted = measure(args.channel, args.rate, args.duration, can_filters)
+        label = "kernel filters" if can_filters else "no filters    "
+        print(f"{label}: CPU {cpu:.2f} s ({100 * cpu / args.duration:.1f}%), forwarded {forwarded}, "
+              f"unrouted frames seen in userspace {unrouted}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Process-wide CAN bus handles: one python-can Bus per channel, shared by the gateway and the send helpers
+import atexit
+import queue
+import threading
+import can
+
+TX_BURST = 64  # Frames sent per wakeup of a transmit thread at most
+
+_buses = {}  # (channel, bustype) -> SharedBus
+_pinned = set()  # Channels held open by get_bus()
+_lock = threading.Lock()
+_atexit_registered = False
+
+class SharedBus:
+    """A long-lived bus handle whose frames are sent by one transmit thread
+
+    send() only queues, so callers on the GUI thread or the gateway loop never block on the
+    socket; the thread wakes once per burst of queued frames. Failed sends are counted in
+    errors and reported to the optional done callback of the frame.
+    """
+    def __init__(self, channel, bustype):
+        self.channel = channel
+        self.bustype = bustype
+        self.bus = can.interface.Bus(channel=channel, bustype=bustype)
+        self.users = 0
+        self.errors = 0  # Frames the bus refused
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"can-tx-{channel}")
+        self.thread.start()
+
+    def send(self, message, done=None):
+        """Queue a can.Message for the transmit thread, callable from any thread
+
+        done(error) is called on the transmit thread once the frame was sent (error None)
+        or refused by the bus.
+        """
+        self.queue.put((message, done))
+
+    def run(self):
+        running = True
+        while running:
+            burst = [self.queue.get()]
+            # Take whatever was queued meanwhile, up to TX_BURST frames
+            while len(burst) < TX_BURST:
+                try:
+                    burst.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in burst:
+                if item is None:  # Sentinel queued by close(), frames before it are still sent
+                    running = False
+                    break
+                message, done = item
+                error = None
+                # Nothing raised here may end the thread, the frames queued after it would be lost
+                try:
+                    self.bus.send(message)
+                except Exception as e:
+                    error = e
+                    self.errors += 1
+                    if done is None:
+                        print(f"Error sending CAN message: {e}")
+                if done is not None:
+                    try:
+                        done(error)
+                    except Exception as e:
+                        print(f"Error reporting a CAN send: {e}")
+
+    def close(self):
+        """Send the queued frames and shut the bus down"""
+        self.queue.put(None)
+        self.thread.join()
+        self.bus.shutdown()
+
+def acquire(channel="vcan0", bustype="socketcan"):
+    """Return the SharedBus of a channel, opening it on first use; pair with release()"""
+    with _lock:
+        return _acquire(channel, bustype)
+
+def _acquire(channel, bustype):
+    global _atexit_registered
+    shared = _buses.get((channel, bustype))
+    if shared is None:
+        shared = _buses[(channel, bustype)] = SharedBus(channel, bustype)
+        if not _atexit_registered:
+            atexit.register(shutdown)
+            _atexit_registered = True
+    shared.users += 1
+    return shared
+
+def release(shared):
+    """Drop one use of a SharedBus, closing it when it was the last one"""
+    with _lock:
+        shared.users -= 1
+        if shared.users > 0 or _buses.get((shared.channel, shared.bustype)) is not shared:
+            return
+        del _buses[(shared.channel, shared.bustype)]
+    shared.close()
+
+def get_bus(channel="vcan0", bustype="socketcan"):
+    """Return the SharedBus of a channel for the send helpers, kept open until shutdown()"""
+    with _lock:
+        if (channel, bustype) in _pinned:
+            return _buses[(channel, bustype)]
+        # The helpers' use is never released, a gateway stopping does not close the bus under them
+        _pinned.add((channel, bustype))
+        return _acquire(channel, bustype)
+
+def shutdown():
+    """Close every bus still open, runs at exit"""
+    with _lock:
+        buses = list(_buses.values())
+        _buses.clear()
+        _pinned.clear()
+    for shared in buses:
+        shared.close()
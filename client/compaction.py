@@ -0,0 +1,66 @@
+# Run-length compaction of repeated identical frames
+import heapq
+import itertools
+
+# Positions in the loader rows (timestamp, message_id, data, type, length, rowid, repeat_count, last_timestamp)
+REPEAT_COUNT = 6
+LAST_TIMESTAMP = 7
+
+class RepeatRun:
+    """Last stored row of one (table, message_id, type) stream and the repeats not written yet"""
+    __slots__ = ("rowid", "row", "pending", "first_timestamp", "last_timestamp")
+
+    def __init__(self, rowid, row):
+        self.rowid = rowid
+        self.row = row  # As inserted: (timestamp, message_id, id_num, data, type, length, session_id)
+        self.pending = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def matches(self, row):
+        """True if row repeats the payload of this run within the same session"""
+        return self.row[3] == row[3] and self.row[6] == row[6]
+
+    def add(self, timestamp):
+        if not self.pending:
+            self.first_timestamp = timestamp
+        self.pending += 1
+        self.last_timestamp = timestamp
+
+def repeat_timestamps(row):
+    """Yield the timestamps of the messages collapsed into a row, spread evenly over its run"""
+    count = row[REPEAT_COUNT]
+    first = row[0]
+    last = row[LAST_TIMESTAMP]
+    for i in range(count):
+        yield first + (last - first) * i // (count - 1)
+
+def expand_repeats(rows):
+    """Expand compacted rows of a chronological stream into one row per message, in time order
+
+    Runs overlap later rows, so expanded messages wait in a heap until the raw stream
+    has moved past them; memory grows with the number of overlapping runs only.
+    Reverse streams cannot be expanded this way: they are ordered by the first timestamp
+    of each run, and the newest repeats of a run belong before rows already yielded.
+    """
+    heap = []
+    order = itertools.count()  # Tie breaker, rows themselves are never compared
+    for row in rows:
+        while heap and heap[0][0] <= row[0]:
+            yield from pop_expanded(heap)
+        if row[REPEAT_COUNT] <= 1:
+            yield row
+            continue
+        timestamps = repeat_timestamps(row)
+        heapq.heappush(heap, (next(timestamps), next(order), row, timestamps))
+    while heap:
+        yield from pop_expanded(heap)
+
+def pop_expanded(heap):
+    timestamp, order, row, timestamps = heap[0]
+    yield (timestamp, *row[1:REPEAT_COUNT], 1, timestamp)
+    following = next(timestamps, None)
+    if following is None:
+        heapq.heappop(heap)
+    else:
+        heapq.heapreplace(heap, (following, order, row, timestamps))
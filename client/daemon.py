@@ -0,0 +1,103 @@
+# Headless gateway: forwards CAN <-> SOME/IP and records every message without Qt
+# Run the GUI with --attach to watch the database it records into
+import argparse
+import asyncio
+import signal
+import time
+import database_options
+import routing
+from gateway import Gateway, LISTEN_PORT
+import bus_manager
+import profiling
+
+METRICS_INTERVAL = 10.0  # Seconds between two metrics lines, 0 disables them
+
+class GatewayMetrics:
+    """Messages forwarded per direction, written on the gateway loop"""
+    def __init__(self, routes, shared_bus):
+        self.can_to_someip = 0
+        self.someip_to_can = 0
+        self.routes = routes  # Counts the dropped messages without a route
+        self.shared_bus = shared_bus  # Counts the frames the bus refused
+
+    def report(self, elapsed, last):
+        """Print the counters and the rates since the previous report, return the counters for the next one"""
+        can_rate = (self.can_to_someip - last[0]) / elapsed
+        someip_rate = (self.someip_to_can - last[1]) / elapsed
+        print(f"[gateway] CAN->SomeIP {self.can_to_someip} ({can_rate:.1f}/s), "
+              f"SomeIP->CAN {self.someip_to_can} ({someip_rate:.1f}/s), "
+              f"unrouted CAN {self.routes.unrouted_can}, unrouted SomeIP {self.routes.unrouted_someip}, "
+              f"CAN send errors {self.shared_bus.errors}")
+        return self.can_to_someip, self.someip_to_can
+
+class GatewayRecorder:
+    """Forwarder callbacks saving messages the way the GUI tabs do"""
+    def __init__(self, database, metrics):
+        self.database = database
+        self.metrics = metrics
+
+    def can_received(self, message_id, data):
+        self.database.save_message("CAN", message_id, data, "Rx")
+
+    def someip_sent(self, message_id, data):
+        self.database.save_message("SomeIP", message_id, data, "Tx")
+        self.metrics.can_to_someip += 1
+
+    def someip_received(self, message_id, data):
+        self.database.save_message("SomeIP", message_id, data, "Rx")
+
+    def can_sent(self, message_id, data, msg_type="Tx"):
+        self.database.save_message("CAN", message_id, data, msg_type)
+        self.metrics.someip_to_can += 1
+
+async def report_metrics(metrics, interval):
+    last = (0, 0)
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        last = metrics.report(now - last_time, last)
+        last_time = now
+
+async def serve(gateway, metrics, interval):
+    # SIGINT and SIGTERM stop the gateway at once, its tasks are cancelled mid-wait
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, gateway.stop)
+    tasks = [report_metrics(metrics, interval)] if interval else []
+    await gateway.serve(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless CAN <-> SOME/IP gateway")
+    profiling.add_arguments(parser)
+    database_options.add_arguments(parser)
+    routing.add_arguments(parser)
+    parser.add_argument("--channel", default="vcan0", help="CAN channel")
+    parser.add_argument("--bustype", default="socketcan", help="python-can interface")
+    parser.add_argument("--listen-port", type=int, default=LISTEN_PORT, help="UDP port of incoming SOME/IP messages")
+    parser.add_argument("--no-can-filters", action="store_true",
+                        help="Receive every CAN frame instead of installing filters for the routed IDs")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="Seconds between two metrics lines, 0 disables them")
+    args = parser.parse_args()
+    profiling.configure(args)
+    routes = routing.load_routes(args.routes)
+
+    db = database_options.open_database(args, session_label="gateway")
+    shared_bus = bus_manager.acquire(args.channel, args.bustype)
+    metrics = GatewayMetrics(routes, shared_bus)
+    recorder = GatewayRecorder(db, metrics)
+    gateway = Gateway(shared_bus.bus, transmit=shared_bus.send,
+                      on_can_received=recorder.can_received, on_someip_sent=recorder.someip_sent,
+                      on_someip_received=recorder.someip_received, on_can_sent=recorder.can_sent,
+                      listen_port=args.listen_port, routes=routes, can_filters=not args.no_can_filters)
+    print(f"Gateway running, recording into {args.db} (session {db.session_id})")
+    try:
+        asyncio.run(serve(gateway, metrics, args.metrics_interval))
+    finally:
+        bus_manager.release(shared_bus)
+    db.close()
+    print("Gateway stopped")
+
+if __name__ == "__main__":
+    main()
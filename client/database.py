@@ -1,102 +1,851 @@
+import heapq
+import os
+import queue
+from concurrent.futures import Future
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from compaction import RepeatRun, REPEAT_COUNT
+from compaction import expand_repeats as expand_repeats_rows
+from retention import RetentionTask, incremental_vacuum
+from readpool import ReadPool, READ_POOL_SIZE
+from snapshot import SnapshotTask, memory_uri, restore_snapshot, save_snapshot, SNAPSHOT_INTERVAL
+from rollups import (create_rollup_tables, write_rollups, backfill_rollups, clear_rollups,
+                     rebuild_rollups, pick_resolution, load_rollup, payload_value)
+
+FLUSH_INTERVAL = 0.5  # Seconds a queued message may wait before being written
+BATCH_SIZE = 500      # Queued messages that trigger an immediate flush
+PAGE_SIZE = 1000      # Rows fetched per query by the paged loaders
+WRITE_BUSY_TIMEOUT = 30000  # Milliseconds the writer waits for a lock held by another connection
+RETRY_DELAY = 0.1           # Seconds before the first retry of a batch that found the database locked
+MAX_RETRY_DELAY = 5.0       # Longest wait between two retries
+
+# Schema version stored in PRAGMA user_version
+# 1: TEXT "%d-%m-%Y %H:%M:%S" timestamps, no indexes
+# 2: INTEGER nanosecond epoch timestamps, indexes on (type, timestamp), timestamp and message_id
+# 3: message IDs normalized to INTEGER id_num, indexed with (id_num, timestamp)
+# 4: payloads stored as raw BLOB instead of hex TEXT
+# 5: per-second and per-minute rollup tables of decoded payload values
+# 6: recording sessions, session_id on the message tables indexed with (session_id, timestamp)
+# 7: repeat_count and last_timestamp for run-length compacted rows
+SCHEMA_VERSION = 7
+LEGACY_TIMESTAMP_FORMAT = "%d-%m-%Y %H:%M:%S"
+MESSAGE_TABLES = ("CAN", "SomeIP")
+INSERT_COLUMNS = ("timestamp", "message_id", "id_num", "data", "type", "length", "session_id")
+MAX_ID_DIGITS = 8     # 29-bit extended CAN IDs and 32-bit SOME/IP message IDs, longer stored IDs widen it
+MIN_TRIGRAM = 3       # Shorter substrings cannot use the trigram index
+
+def format_timestamp(timestamp):
+    """Format a nanosecond epoch timestamp for display"""
+    if not isinstance(timestamp, int):
+        return str(timestamp)
+    seconds, nanoseconds = divmod(timestamp, 1_000_000_000)
+    return datetime.fromtimestamp(seconds).strftime(LEGACY_TIMESTAMP_FORMAT) + f".{nanoseconds // 1_000_000:03d}"
+
+def hex_digits(message_id):
+    """Return the hex digits of an ID such as '0x123' or 'X055', without leading zeros"""
+    text = str(message_id).strip().lower()
+    if text.startswith("0x"):
+        text = text[2:]
+    elif text.startswith("x"):
+        text = text[1:]
+    if not text or any(c not in "0123456789abcdef" for c in text):
+        return None
+    return text.lstrip("0") or "0"
+
+def normalize_message_id(message_id):
+    """Return the integer value of a hex message ID, or None if it is not one"""
+    if isinstance(message_id, int):
+        return message_id
+    digits = hex_digits(message_id)
+    return int(digits, 16) if digits is not None else None
+
+def parse_id_filter(text):
+    """Parse the message ID filter syntax into (kind, value)
+
+    0x123 is an exact ID, 0x100-0x1ff an inclusive range, 0x12* a hex prefix and
+    ~12 a substring of the ID as stored. Anything else is a substring search.
+    """
+    text = text.strip()
+    if text.startswith("~"):
+        return "substring", text[1:]
+    if text.endswith("*"):
+        digits = hex_digits(text[:-1])
+        if digits is not None:
+            return "prefix", digits
+    elif "-" in text:
+        low, high = (normalize_message_id(part) for part in text.split("-", 1))
+        if low is not None and high is not None:
+            return "range", (min(low, high), max(low, high))
+    else:
+        value = normalize_message_id(text)
+        if value is not None:
+            return "exact", value
+    return "substring", text
+
+def prefix_ranges(digits, width=MAX_ID_DIGITS):
+    """Return the id_num ranges of up to `width` hex digits whose representation starts with `digits`"""
+    value = int(digits, 16)
+    if value == 0:
+        return [(0, 0)]
+    ranges = []
+    for length in range(len(digits), max(width, len(digits)) + 1):
+        shift = 4 * (length - len(digits))
+        ranges.append((value << shift, ((value + 1) << shift) - 1))
+    return ranges
+
+def to_payload(data):
+    """Return a payload as bytes, decoding hex strings and falling back to UTF-8 text"""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    try:
+        return bytes.fromhex(data.replace(" ", ""))
+    except ValueError:
+        return data.encode("utf-8")
+
+def is_locked(error):
+    """Return True if a sqlite3 error is a lock held by another connection, worth retrying"""
+    return getattr(error, "sqlite_errorname", None) in ("SQLITE_BUSY", "SQLITE_LOCKED") or \
+        "locked" in str(error) or "busy" in str(error)
+
+def parse_legacy_timestamp(text):
+    """Convert a schema version 1 TEXT timestamp to nanoseconds since the epoch"""
+    try:
+        return int(datetime.strptime(text, LEGACY_TIMESTAMP_FORMAT).timestamp()) * 1_000_000_000
+    except (TypeError, ValueError):
+        return 0
+
+class BatchWriter(threading.Thread):
+    """Background thread that writes queued messages in batched transactions"""
+    _STOP = object()
+
+    def __init__(self, database, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, compact_repeats=False):
+        super().__init__(name="db-writer", daemon=True)
+        self.database = database
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        
+        # Consecutive identical frames of a (table, message_id, type) stream are stored as one row
+        self.compact_repeats = compact_repeats
+        self.runs = {}
+
+    def put(self, table, row):
+        self.queue.put((table, row))
+
+    def flush(self, timeout=None):
+        """Block until every message queued before this call is committed"""
+        if not self.is_alive():
+            return True
+        barrier = threading.Event()
+        self.queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def execute(self, fn):
+        """Run fn(conn) on the writer thread after the rows queued before it, return a Future of its result"""
+        future = Future()
+        if not self.is_alive():
+            future.set_exception(RuntimeError("Database writer is not running"))
+            return future
+        self.queue.put((fn, future))
+        return future
+
+    def stop(self):
+        """Write everything still queued and stop the thread"""
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join()
+
+    def run(self):
+        # SQLite connections are bound to the thread that created them
+        conn = self.database.connect()
+        # Long transactions of other connections (retention, imports of other processes) are waited for
+        conn.execute(f"PRAGMA busy_timeout = {WRITE_BUSY_TIMEOUT}")
+        pending = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if not pending else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self.write_batch(conn, pending)
+                    continue
+
+                if item is self._STOP:
+                    self.write_batch(conn, pending)
+                    break
+                if isinstance(item, threading.Event):
+                    self.write_batch(conn, pending)
+                    item.set()
+                    continue
+                if isinstance(item[1], Future):
+                    # (fn, future) from execute()
+                    self.write_batch(conn, pending)
+                    self.run_call(conn, *item)
+                    continue
+
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+                if len(pending) >= self.batch_size:
+                    self.write_batch(conn, pending)
+        finally:
+            conn.close()
+
+    def run_call(self, conn, fn, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(conn))
+        except Exception as e:
+            future.set_exception(e)
+        # The call may have deleted rows the runs point to
+        self.runs.clear()
+
+    def write_batch(self, conn, pending):
+        """Insert all pending rows with executemany in a single transaction
+
+        A batch that finds the database locked is kept and retried with backoff, the
+        queue fills up meanwhile and is written once the lock is released.
+        """
+        if not pending:
+            return
+        rows_by_table = {}
+        for table, row in pending:
+            rows_by_table.setdefault(table, []).append(row)
+        delay = RETRY_DELAY
+        while True:
+            try:
+                with conn:
+                    for table, rows in rows_by_table.items():
+                        if self.compact_repeats:
+                            self.write_compacted(conn, table, rows)
+                        else:
+                            conn.executemany(self.insert_sql(table), rows)
+                    # Rollups are updated in the same transaction: (timestamp, message_id, type, data)
+                    write_rollups(conn, {table: [(row[0], row[1], row[4], row[3]) for row in rows]
+                                         for table, rows in rows_by_table.items()})
+                break
+            except sqlite3.Error as e:
+                # The rolled back rows may be referenced by the runs, a retry inserts them again
+                self.runs.clear()
+                if not is_locked(e):
+                    print(f"Error writing messages to database: {e}")
+                    break
+                print(f"Database locked, retrying {len(pending)} messages in {delay:.1f} s")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        pending.clear()
+
+    def insert_sql(self, table):
+        return (f"INSERT INTO {table} ({', '.join(INSERT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))})")
+
+    def write_compacted(self, conn, table, rows):
+        """Insert rows, folding repeats of the previous frame of their stream into its row"""
+        insert_sql = self.insert_sql(table)
+        dirty = []
+        for row in rows:
+            key = (table, row[1], row[4])  # (table, message_id, type)
+            run = self.runs.get(key)
+            if run is not None and run.matches(row):
+                if not run.pending:
+                    dirty.append(run)
+                run.add(row[0])
+                continue
+            if run is not None and run.pending:
+                self.write_run(conn, table, run)
+            self.runs[key] = RepeatRun(conn.execute(insert_sql, row).lastrowid, row)
+        for run in dirty:
+            if run.pending:
+                self.write_run(conn, table, run)
+
+    def write_run(self, conn, table, run):
+        """Add the pending repeats of a run to its stored row"""
+        updated = conn.execute(f'''UPDATE {table} SET repeat_count = repeat_count + ?, last_timestamp = ?
+                                    WHERE rowid = ? AND data = ? AND session_id IS ?''',
+                               (run.pending, run.last_timestamp, run.rowid, run.row[3], run.row[6])).rowcount
+        if not updated:
+            # The row was deleted meanwhile (retention, clear), the repeats start a new row
+            columns = INSERT_COLUMNS + ("repeat_count", "last_timestamp")
+            run.rowid = conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                     f"VALUES ({', '.join('?' * len(columns))})",
+                                     (run.first_timestamp, *run.row[1:], run.pending, run.last_timestamp)).lastrowid
+        run.pending = 0
 
 class Database:
-    def __init__(self, db_name="messages.db"):
+    def __init__(self, db_name="messages.db", flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE,
+                 substring_index=False, retention=None, session_label=None, compact_repeats=False,
+                 in_memory=False, snapshot_interval=SNAPSHOT_INTERVAL, read_pool_size=READ_POOL_SIZE,
+                 attach=False):
         self.db_name = db_name
+        # Attached to a database recorded by another process (the gateway daemon), without a session of its own.
+        # The viewer never maintains the recorder's file: a memdb copy would be snapshotted back over it.
+        if attach and in_memory:
+            raise ValueError("An attached viewer cannot use an in-memory database")
+        self.attach = attach
+        # In memory mode the live database is a memdb copy of db_name, saved back by snapshots
+        self.memory_uri = memory_uri(f"pfe-{os.getpid()}-{id(self)}") if in_memory else None
         self.conn = self.init_db()
+        
+        # self.conn belongs to the creating (GUI) thread, other threads read through the pool
+        self.owner_thread = threading.get_ident()
+        self.readers = ReadPool(lambda: self.connect(check_same_thread=False), read_pool_size)
+        
+        # Every start records into a new session, an attached viewer follows the recorder's session
+        self.session_id = self.latest_session() if attach else self.start_session(session_label)
+        
+        # Optional FTS5 trigram index for ~substring ID filters
+        if substring_index:
+            self.create_substring_index()
+        self.substring_tables = self.find_substring_indexes()
         #self.clear_database()
         
+        # Inserts are queued and written by a background thread
+        self.writer = BatchWriter(self, flush_interval, batch_size, compact_repeats)
+        self.writer.start()
+        
+        # Old messages are deleted by a background thread when a RetentionPolicy is given
+        self.retention = None
+        if retention is not None and retention.is_enabled() and not attach:
+            self.retention = RetentionTask(self, retention, MESSAGE_TABLES)
+            self.retention.start()
+        
+        # The in-memory database is copied to db_name in the background
+        self.snapshots = None
+        if self.memory_uri is not None and snapshot_interval:
+            self.snapshots = SnapshotTask(self, db_name, snapshot_interval)
+            self.snapshots.start()
+
+    def connect(self, check_same_thread=True):
+        """Open a new connection to the database"""
+        if self.memory_uri is not None:
+            # WAL and synchronous do not apply to memdb
+            return sqlite3.connect(self.memory_uri, uri=True, check_same_thread=check_same_thread)
+        conn = sqlite3.connect(self.db_name, check_same_thread=check_same_thread)
+        # WAL lets the reader connection and the writer thread work concurrently,
+        # synchronous=NORMAL only syncs at checkpoints instead of on every commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Truncate the WAL file after checkpoints so it does not keep its peak size
+        conn.execute("PRAGMA journal_size_limit=67108864")
+        return conn
+
+    def enable_incremental_vacuum(self, conn):
+        """Switch to auto_vacuum=INCREMENTAL so space freed by deletes can be reclaimed"""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # Once the file has pages (even just from switching to WAL) the mode only changes with a VACUUM
+        if conn.execute("SELECT count(*) FROM sqlite_master").fetchone()[0]:
+            print("Enabling incremental vacuum, rebuilding database...")
+        conn.execute("VACUUM")
 
     def init_db(self):
-        """Initialize the database and create tables if they don't exist"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS CAN
-                        (timestamp TEXT, message_id TEXT, data TEXT, type TEXT, length INTEGER)''')
-        cursor.execute('''CREATE TABLE IF NOT EXISTS SomeIP
-                        (timestamp TEXT, message_id TEXT, data TEXT, type TEXT, length INTEGER)''')
-        conn.commit()
+        """Initialize the database, creating or migrating the tables to SCHEMA_VERSION"""
+        conn = self.connect()
+        if self.memory_uri is not None and restore_snapshot(self.db_name, self.memory_uri):
+            print(f"Loaded {self.db_name} into memory")
+        self.enable_incremental_vacuum(conn)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # Run the whole upgrade in one transaction so an interrupted migration leaves the old schema intact
+            conn.execute("BEGIN")
+            try:
+                existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                if not existing.intersection(MESSAGE_TABLES):
+                    self.create_tables(conn)
+                else:
+                    self.upgrade_schema(conn, version)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
         return conn
 
+    def create_tables(self, conn):
+        """Create the message tables and their indexes at the current schema version"""
+        for table in MESSAGE_TABLES:
+            conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                            (timestamp INTEGER NOT NULL, message_id TEXT, id_num INTEGER, data BLOB, type TEXT,
+                             length INTEGER, session_id INTEGER, repeat_count INTEGER NOT NULL DEFAULT 1,
+                             last_timestamp INTEGER)''')
+            self.create_indexes(conn, table)
+            self.create_id_index(conn, table)
+            self.create_session_index(conn, table)
+        create_rollup_tables(conn)
+        self.create_sessions_table(conn)
+
+    def create_indexes(self, conn, table):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_type_timestamp ON {table} (type, timestamp)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)")
+
+    def create_id_index(self, conn, table):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id_num_timestamp ON {table} (id_num, timestamp)")
+
+    def create_session_index(self, conn, table):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_session_timestamp ON {table} (session_id, timestamp)")
+
+    def create_sessions_table(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS sessions
+                        (id INTEGER PRIMARY KEY, started INTEGER NOT NULL, ended INTEGER, label TEXT)''')
+
+    def upgrade_schema(self, conn, version):
+        """Migrate existing message tables in place, one schema version at a time"""
+        if version < 2:
+            # A table missing from an old file gets the version 1 layout so every step applies to it
+            for table in MESSAGE_TABLES:
+                conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                                (timestamp TEXT, message_id TEXT, data TEXT, type TEXT, length INTEGER)''')
+            self.migrate_to_v2(conn)
+        if version < 3:
+            self.migrate_to_v3(conn)
+        if version < 4:
+            self.migrate_to_v4(conn)
+        if version < 5:
+            self.migrate_to_v5(conn)
+        if version < 6:
+            self.migrate_to_v6(conn)
+        if version < 7:
+            self.migrate_to_v7(conn)
+
+    def migrate_to_v2(self, conn):
+        """Convert TEXT timestamps to INTEGER nanoseconds and add the indexes"""
+        conn.create_function("legacy_timestamp", 1, parse_legacy_timestamp, deterministic=True)
+        for table in MESSAGE_TABLES:
+            columns = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if columns.get("timestamp", "").upper() == "TEXT":
+                print(f"Migrating {table} timestamps to nanosecond integers...")
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+                conn.execute(f'''CREATE TABLE {table}
+                                (timestamp INTEGER NOT NULL, message_id TEXT, data TEXT, type TEXT, length INTEGER)''')
+                # Keep the insertion order so rows sharing a legacy second stay in sequence
+                conn.execute(f'''INSERT INTO {table} (timestamp, message_id, data, type, length)
+                                SELECT legacy_timestamp(timestamp), message_id, data, type, length
+                                FROM {table}_v1 ORDER BY rowid''')
+                conn.execute(f"DROP TABLE {table}_v1")
+            self.create_indexes(conn, table)
+
+    def migrate_to_v3(self, conn):
+        """Add the normalized integer id_num column, replacing the TEXT message_id index"""
+        conn.create_function("normalize_message_id", 1, normalize_message_id, deterministic=True)
+        for table in MESSAGE_TABLES:
+            print(f"Normalizing {table} message IDs...")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN id_num INTEGER")
+            conn.execute(f"UPDATE {table} SET id_num = normalize_message_id(message_id)")
+            conn.execute(f"DROP INDEX IF EXISTS idx_{table}_message_id")
+            self.create_id_index(conn, table)
+
+    def migrate_to_v4(self, conn):
+        """Convert hex TEXT payloads to BLOBs in one bulk UPDATE per table"""
+        # Updating in place keeps rowids, indexes and triggers; BLOB values are stored as-is whatever the declared type
+        conn.create_function("to_payload", 1, to_payload, deterministic=True)
+        for table in MESSAGE_TABLES:
+            print(f"Converting {table} payloads to BLOB...")
+            conn.execute(f"UPDATE {table} SET data = to_payload(data) WHERE typeof(data) = 'text'")
+            conn.execute(f"UPDATE {table} SET length = length(data) WHERE length IS NULL")
+
+    def migrate_to_v5(self, conn):
+        """Create the rollup tables and aggregate the rows already recorded"""
+        print("Building rollups of recorded messages...")
+        create_rollup_tables(conn)
+        backfill_rollups(conn, MESSAGE_TABLES)
+
+    def migrate_to_v6(self, conn):
+        """Add session_id and file the rows recorded so far under one imported session"""
+        self.create_sessions_table(conn)
+        bounds = [conn.execute(f"SELECT min(timestamp), max(timestamp) FROM {table}").fetchone()
+                  for table in MESSAGE_TABLES]
+        starts = [low for low, _high in bounds if low is not None]
+        ends = [high for _low, high in bounds if high is not None]
+        session_id = None
+        if starts:
+            session_id = conn.execute("INSERT INTO sessions (started, ended, label) VALUES (?, ?, ?)",
+                                      (min(starts), max(ends), "Imported")).lastrowid
+        for table in MESSAGE_TABLES:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN session_id INTEGER")
+            if session_id is not None:
+                conn.execute(f"UPDATE {table} SET session_id = ?", (session_id,))
+            self.create_session_index(conn, table)
+
+    def migrate_to_v7(self, conn):
+        """Add the run-length columns, existing rows are single messages"""
+        for table in MESSAGE_TABLES:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN repeat_count INTEGER NOT NULL DEFAULT 1")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN last_timestamp INTEGER")
+
+    def create_substring_index(self):
+        """Create FTS5 trigram indexes over message_id, kept in sync by triggers"""
+        for table in MESSAGE_TABLES:
+            fts = f"{table}_id_fts"
+            try:
+                with self.conn:
+                    exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+                    if exists:
+                        continue
+                    self.conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5(message_id, content='{table}', "
+                                      f"content_rowid='rowid', tokenize='trigram')")
+                    self.conn.execute(f"""CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN
+                        INSERT INTO {fts} (rowid, message_id) VALUES (new.rowid, new.message_id); END""")
+                    self.conn.execute(f"""CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN
+                        INSERT INTO {fts} ({fts}, rowid, message_id) VALUES ('delete', old.rowid, old.message_id); END""")
+                    # Index the rows that already exist
+                    self.conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                # SQLite builds without FTS5 or the trigram tokenizer fall back to LIKE
+                print(f"Substring index not available: {e}")
+                return
+
+    def find_substring_indexes(self):
+        names = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {table for table in MESSAGE_TABLES if f"{table}_id_fts" in names}
+
     def save_message(self, table, message_id, data, msg_type, length=None):
-        """Save a message to the database"""
-        timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+        """Queue a message for the database and return its nanosecond timestamp immediately
+
+        data may be bytes or a hex string and is stored as a raw BLOB.
+        """
+        timestamp = time.time_ns()
+        payload = to_payload(data)
     
         # Calculate length if not provided
-        if length is None and isinstance(data, str):
-            try:
-                length = len(bytes.fromhex(data.replace(" ", "")))
-            except ValueError:
-                length = len(data)
-        elif length is None:
-            length = len(data)
+        if length is None:
+            length = len(payload)
     
-        cursor = self.conn.cursor()
-        cursor.execute(f"INSERT INTO {table} (timestamp, message_id, data, type, length) VALUES (?, ?, ?, ?, ?)", 
-                    (timestamp, message_id, data, msg_type, length))
-        self.conn.commit()
+        self.writer.put(table, (timestamp, message_id, normalize_message_id(message_id), payload, msg_type, length,
+                                self.session_id))
         return timestamp
 
-    def load_messages(self, table):
-        """Load all messages from a specific table"""
-        cursor = self.conn.cursor()
-        cursor.execute(f"SELECT timestamp, message_id, data, type, length FROM {table}")
-        return cursor.fetchall()
+    def flush(self, timeout=None):
+        """Wait until all queued messages are written to the database"""
+        return self.writer.flush(timeout)
 
-    def load_messages_filtered(self, table, message_id=None, msg_type=None):
-        """Load messages from a specific table with optional filters"""
-        cursor = self.conn.cursor()
+    @contextmanager
+    def reading(self):
+        """Yield a connection for queries: the main connection on its thread, a pooled snapshot elsewhere"""
+        if threading.get_ident() == self.owner_thread:
+            yield self.conn
+        else:
+            with self.readers.snapshot() as conn:
+                yield conn
 
-        # Start with base query
-        query = f"SELECT timestamp, message_id, data, type, length FROM {table}"
-        params = []
+    def load_messages(self, table, expand_repeats=False):
+        """Stream all messages from a specific table in chronological order"""
+        return self.iter_messages(table, expand_repeats=expand_repeats)
+
+    def load_messages_filtered(self, table, message_id=None, msg_type=None, expand_repeats=False):
+        """Stream messages from a specific table with optional filters"""
+        return self.iter_messages(table, message_id=message_id, msg_type=msg_type, expand_repeats=expand_repeats)
 
-        # Add filters if provided
+    def filter_conditions(self, table, message_id=None, msg_type=None, session_id=None):
+        """Build the WHERE conditions and parameters for the message filters"""
         conditions = []
+        params = []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
         if message_id:
-            conditions.append("message_id LIKE ?")
-            params.append(f"%{message_id}%")
+            kind, value = parse_id_filter(message_id)
+            if kind == "exact":
+                conditions.append("id_num = ?")
+                params.append(value)
+            elif kind == "range":
+                conditions.append("id_num BETWEEN ? AND ?")
+                params.extend(value)
+            elif kind == "prefix":
+                # One index range per possible ID length, up to the longest ID stored in the table
+                ranges = prefix_ranges(value, self.id_digits(table))
+                conditions.append("(" + " OR ".join(["id_num BETWEEN ? AND ?"] * len(ranges)) + ")")
+                for low, high in ranges:
+                    params.extend((low, high))
+            elif table in self.substring_tables and len(value) >= MIN_TRIGRAM:
+                conditions.append(f"rowid IN (SELECT rowid FROM {table}_id_fts WHERE {table}_id_fts MATCH ?)")
+                params.append('"' + value.replace('"', '""') + '"')
+            else:
+                conditions.append("message_id LIKE ?")
+                params.append(f"%{value}%")
         if msg_type:
             conditions.append("type = ?")
             params.append(msg_type)
+        return conditions, params
+
+    def load_page(self, table, limit=PAGE_SIZE, after=None, reverse=False, message_id=None, msg_type=None,
+                  session_id=None):
+        """Load one page of up to `limit` rows ordered by (timestamp, rowid)
+
+        Rows are (timestamp, message_id, data, type, length, rowid, repeat_count, last_timestamp)
+        with data as bytes; repeat_count is above 1 for run-length compacted rows. `after` is the
+        (timestamp, rowid) key of the last row of the previous page; with reverse=True
+        pages run from the newest row backwards, for tail views.
+        """
+        self.flush()
+        return self.query_page(table, limit, after, reverse, message_id, msg_type, session_id)
 
-        # Add WHERE clause if we have conditions
+    def id_digits(self, table):
+        """Return the hex digit count of the largest stored ID, at least MAX_ID_DIGITS"""
+        # SOME/IP IDs are built as hex(service_id) followed by the decimal method_id and can be longer
+        with self.reading() as conn:
+            largest = conn.execute(f"SELECT max(id_num) FROM {table}").fetchone()[0]
+        return max(MAX_ID_DIGITS, len(format(largest, "x"))) if largest is not None else MAX_ID_DIGITS
+
+    def query_page(self, table, limit, after, reverse, message_id, msg_type, session_id=None):
+        conditions, params = self.filter_conditions(table, message_id, msg_type, session_id)
+        if after is not None:
+            # Row value comparison on the index columns: a range seek, not an OFFSET scan
+            conditions.append("(timestamp, rowid) < (?, ?)" if reverse else "(timestamp, rowid) > (?, ?)")
+            params.extend(after)
+        query = (f"SELECT timestamp, message_id, data, type, length, rowid, repeat_count, "
+                 f"coalesce(last_timestamp, timestamp) FROM {table}")
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
+        order = "DESC" if reverse else "ASC"
+        query += f" ORDER BY timestamp {order}, rowid {order} LIMIT ?"
+        params.append(limit)
+        with self.reading() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def iter_messages(self, table, page_size=PAGE_SIZE, after=None, reverse=False, message_id=None, msg_type=None,
+                      session_id=None, expand_repeats=False):
+        """Yield messages page by page, holding at most one page in memory
 
-        # Execute query
-        cursor.execute(query, params)
-        return cursor.fetchall()
-
-    def load_message_sequence(self):
-        """Load messages in chronological order from CAN and SomeIP tables"""
-        cursor = self.conn.cursor()
-
-        sql = """
-        SELECT timestamp, 'CAN Rx' AS type, message_id, data, length FROM CAN WHERE type = 'Rx'
-        UNION ALL
-        SELECT timestamp, 'SomeIP Tx' AS type, message_id, data, length FROM SomeIP WHERE type = 'Tx'
-        UNION ALL
-        SELECT timestamp, 'SomeIP Rx' AS type, message_id, data, length FROM SomeIP WHERE type = 'Rx'
-        UNION ALL
-        SELECT timestamp, 'CAN Tx' AS type, message_id, data, length FROM CAN WHERE type = 'Tx'
-        ORDER BY timestamp ASC;
+        With expand_repeats, compacted rows are yielded once per message they stand for;
+        reverse streams yield them as stored, ordered by the first message of each run.
         """
+        if expand_repeats and reverse:
+            raise ValueError("Reverse streams cannot expand compacted rows in time order")
+        rows = self.iter_pages(table, page_size, after, reverse, message_id, msg_type, session_id)
+        return expand_repeats_rows(rows) if expand_repeats else rows
+
+    def iter_pages(self, table, page_size, after, reverse, message_id, msg_type, session_id):
+        self.flush()
+        while True:
+            page = self.query_page(table, page_size, after, reverse, message_id, msg_type, session_id)
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+            after = (last[0], last[5])
+
+    def load_messages_between(self, table, start=None, end=None, msg_type=None, message_id=None):
+        """Load messages with start <= timestamp < end (nanoseconds) in chronological order
+
+        Compacted rows are expanded, a run is selected by the timestamp of its first message.
+        """
+        self.flush()
+        query = (f"SELECT timestamp, message_id, data, type, length, rowid, repeat_count, "
+                 f"coalesce(last_timestamp, timestamp) FROM {table}")
+        params = []
+        conditions = []
+        if message_id is not None:
+            id_num = normalize_message_id(message_id)
+            conditions.append("id_num = ?" if id_num is not None else "message_id = ?")
+            params.append(id_num if id_num is not None else message_id)
+        # With a type filter the (type, timestamp) index serves both the range and the ordering
+        if msg_type:
+            conditions.append("type = ?")
+            params.append(msg_type)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp"
+        with self.reading() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [row[:5] for row in expand_repeats_rows(rows)]
+
+    def load_series(self, table, message_id, msg_type, start=None, end=None, resolution=0):
+        """Load the decoded values of one message ID and direction per time bucket
+
+        Rows are (bucket, count, min, max, avg, last) with bucket in nanoseconds. The
+        coarsest rollup whose bucket is at most `resolution` seconds is used, so a
+        multi-day view reads minute buckets; below one second the raw rows are returned.
+        """
+        self.flush()
+        rollup = pick_resolution(resolution)
+        if rollup is not None:
+            with self.reading() as conn:
+                return load_rollup(conn, rollup, table, message_id, msg_type, start, end)
+        series = []
+        for timestamp, _message_id, data, _type, _length in self.load_messages_between(table, start, end, msg_type,
+                                                                                          message_id):
+            value = payload_value(data)
+            if value is not None:
+                series.append((timestamp, 1, value, value, float(value), value))
+        return series
+
+    def load_message_sequence(self, session_id=None, expand_repeats=True):
+        """Stream messages in chronological order from CAN and SomeIP tables, optionally of one session"""
+        return self.iter_message_sequence(session_id=session_id, expand_repeats=expand_repeats)
+
+    def iter_message_sequence(self, page_size=PAGE_SIZE, reverse=False, session_id=None, expand_repeats=True,
+                              after=None):
+        """Merge the paged CAN and SomeIP streams into one chronological sequence
+
+        Rows are (timestamp, "<table> <type>", message_id, data, length, table, rowid). `after`
+        maps tables to the (timestamp, rowid) key each stream continues from, as in load_page.
+        """
+        after = after or {}
+        streams = [self.iter_sequence_rows(table, page_size, reverse, session_id, expand_repeats, after.get(table))
+                   for table in MESSAGE_TABLES]
+        return heapq.merge(*streams, key=lambda row: row[0], reverse=reverse)
+
+    def iter_sequence_rows(self, table, page_size, reverse, session_id=None, expand_repeats=True, after=None):
+        for timestamp, message_id, data, msg_type, length, rowid, *_rest in self.iter_messages(
+                table, page_size, after, reverse=reverse, session_id=session_id, expand_repeats=expand_repeats):
+            if msg_type in ("Rx", "Tx"):
+                yield (timestamp, f"{table} {msg_type}", message_id, data, length, table, rowid)
     
-        cursor.execute(sql)
-        messages = cursor.fetchall()
-        return messages
-    
+    def start_session(self, label=None):
+        """Open a new recording session and return its ID"""
+        with self.conn:
+            return self.conn.execute("INSERT INTO sessions (started, label) VALUES (?, ?)",
+                                     (time.time_ns(), label)).lastrowid
+
+    def latest_session(self):
+        """Return the ID of the newest session, None if nothing was recorded yet"""
+        with self.reading() as conn:
+            return conn.execute("SELECT max(id) FROM sessions").fetchone()[0]
+
+    def end_session(self):
+        """Record the end time of the current session"""
+        if self.attach:
+            return
+        with self.conn:
+            self.conn.execute("UPDATE sessions SET ended = ? WHERE id = ?", (time.time_ns(), self.session_id))
+
+    def list_sessions(self):
+        """Return (id, started, ended, label, CAN rows, SomeIP rows) for every session, newest first"""
+        self.flush()
+        sessions = []
+        with self.reading() as conn:
+            for session_id, started, ended, label in conn.execute(
+                    "SELECT id, started, ended, label FROM sessions ORDER BY id DESC").fetchall():
+                # Counting through the session index costs the size of the session, not of the table
+                counts = [conn.execute(f"SELECT count(*) FROM {table} WHERE session_id = ?",
+                                       (session_id,)).fetchone()[0] for table in MESSAGE_TABLES]
+                sessions.append((session_id, started, ended, label, *counts))
+        return sessions
+
+    def load_session(self, session_id, page_size=PAGE_SIZE):
+        """Stream the chronological message sequence of one session"""
+        return self.iter_message_sequence(page_size, session_id=session_id)
+
+    def session_summary(self, session_id):
+        """Return {(table, message_id, type): (count, min, max, avg)} of decoded values in a session"""
+        self.flush()
+        summary = {}
+        for table in MESSAGE_TABLES:
+            for row in self.iter_messages(table, session_id=session_id):
+                message_id, data, msg_type, repeats = row[1], row[2], row[3], row[REPEAT_COUNT]
+                value = payload_value(data)
+                count, valued, low, high, total = summary.get((table, message_id, msg_type), (0, 0, None, None, 0))
+                if value is not None:
+                    low = value if low is None else min(low, value)
+                    high = value if high is None else max(high, value)
+                    total += value * repeats
+                    valued += repeats
+                summary[(table, message_id, msg_type)] = (count + repeats, valued, low, high, total)
+        return {key: (count, low, high, total / valued if valued else None)
+                for key, (count, valued, low, high, total) in summary.items()}
+
+    def compare_sessions(self, session_a, session_b):
+        """Return {(table, message_id, type): (summary in session_a, summary in session_b)}"""
+        summary_a = self.session_summary(session_a)
+        summary_b = self.session_summary(session_b)
+        return {key: (summary_a.get(key), summary_b.get(key)) for key in summary_a.keys() | summary_b.keys()}
+
+    def delete_session(self, session_id):
+        """Delete a session with its messages and rebuild the rollups it contributed to"""
+        if self.attach:
+            raise RuntimeError("An attached viewer cannot delete the recorder's sessions")
+        # Runs on the writer connection, a long delete must not lock the writer out
+        self.writer.execute(lambda conn: self.delete_session_rows(conn, session_id)).result()
+
+    def delete_session_rows(self, conn, session_id):
+        with conn:
+            bounds = [conn.execute(f"SELECT min(timestamp), max(timestamp) FROM {table} WHERE session_id = ?",
+                                   (session_id,)).fetchone() for table in MESSAGE_TABLES]
+            for table in MESSAGE_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            starts = [low for low, _high in bounds if low is not None]
+            if starts:
+                rebuild_rollups(conn, MESSAGE_TABLES, min(starts), max(high for _low, high in bounds
+                                                                       if high is not None))
+        incremental_vacuum(conn)
+
     def clear_database(self):
         """Clears all records from the CAN and SomeIP tables"""
-        cursor = self.conn.cursor()
+        if self.attach:
+            raise RuntimeError("An attached viewer cannot clear the recorder's database")
+        # Runs on the writer connection, so it can be called from any thread
+        self.writer.execute(self.clear_tables).result()
+
+    def clear_tables(self, conn):
+        cursor = conn.cursor()
         cursor.execute("DELETE FROM CAN;")
         cursor.execute("DELETE FROM SomeIP;")
-        self.conn.commit()
+        clear_rollups(conn)
+        conn.commit()
+        incremental_vacuum(conn)
 
     
+    def export_messages(self, path, fmt=None, tables=MESSAGE_TABLES, session_id=None, start=None, end=None):
+        """Write the message tables to a Parquet or .npz file in chunks, return the number of rows"""
+        # Imported here so NumPy is only needed by exports
+        from export import export_messages
+        self.flush()
+        with self.reading() as conn:
+            return export_messages(conn, path, tables, fmt, session_id=session_id, start=start, end=end)
+
+    def import_messages(self, path, session_id=None):
+        """Bulk insert a file written by export_messages, into a new session unless one is given"""
+        from export import import_messages
+        # The import is one long transaction, it runs on the writer connection so queued rows wait for it
+        if session_id is not None:
+            return self.writer.execute(lambda conn: import_messages(conn, path, MESSAGE_TABLES, session_id)).result()
+        return self.writer.execute(lambda conn: self.import_session(conn, path)).result()
+
+    def import_session(self, conn, path):
+        from export import import_messages
+        # The session row opens the transaction of the import, a failed import rolls both back
+        session_id = conn.execute("INSERT INTO sessions (started, label) VALUES (?, ?)",
+                                  (time.time_ns(), f"import {os.path.basename(path)}")).lastrowid
+        imported = import_messages(conn, path, MESSAGE_TABLES, session_id)
+        with conn:
+            conn.execute("UPDATE sessions SET ended = ? WHERE id = ?", (time.time_ns(), session_id))
+        return imported
+
+    def snapshot(self):
+        """Save the in-memory database to db_name now"""
+        if self.memory_uri is None:
+            return
+        self.flush()
+        try:
+            save_snapshot(self.conn, self.db_name)
+        except sqlite3.Error as e:
+            print(f"Error saving database snapshot: {e}")
+
     def close(self):
-        """Close the database connection"""
+        """Write pending messages and close the database connection"""
+        if self.retention:
+            self.retention.stop()
+        if self.snapshots:
+            self.snapshots.stop()
+        self.writer.stop()
+        self.readers.close()
+        self.end_session()
+        # The last snapshot includes everything written before closing
+        self.snapshot()
         if self.conn:
             self.conn.close()
\ No newline at end of file
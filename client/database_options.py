@@ -0,0 +1,33 @@
+# Command line options of the message database, shared by the GUI and the headless daemon
+from database import Database
+from retention import RetentionPolicy
+from snapshot import SNAPSHOT_INTERVAL
+
+def add_arguments(parser):
+    parser.add_argument("--db", default="messages.db", help="Message database")
+    parser.add_argument("--retention-days", type=float, default=None,
+                        help="Delete recorded messages older than this many days")
+    parser.add_argument("--max-rows", type=int, default=None, help="Keep at most this many messages per table")
+    parser.add_argument("--max-size-mb", type=float, default=None, help="Keep messages.db below this size")
+    parser.add_argument("--compact-repeats", action="store_true",
+                        help="Store repeated identical frames as one row with a repeat count")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Keep the live database in memory and save snapshots to messages.db")
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL,
+                        help="Seconds between two snapshots in --in-memory mode")
+
+def open_database(args, attach=False, **kwargs):
+    """Open the Database configured by the options of add_arguments()
+
+    With attach, the database of a running recorder is opened for viewing: retention and
+    snapshots stay with the recorder.
+    """
+    if attach:
+        return Database(args.db, attach=True, **kwargs)
+    retention = RetentionPolicy(
+        max_age=args.retention_days * 86400 if args.retention_days is not None else None,
+        max_rows=args.max_rows,
+        max_bytes=int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None
+    )
+    return Database(args.db, retention=retention, compact_repeats=args.compact_repeats,
+                    in_memory=args.in_memory, snapshot_interval=args.snapshot_interval, **kwargs)
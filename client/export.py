@@ -0,0 +1,239 @@
+# Columnar export and bulk import of recorded messages
+# The format follows the file extension, .parquet or .npz; other paths get Parquet when
+# pyarrow is installed and compressed NumPy .npz otherwise, in both directions
+import argparse
+import os
+import numpy as np
+from readpool import open_reader
+from rollups import payload_value, expand_runs, write_rollups
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_CHUNK = 50000  # Rows fetched and converted per step
+
+# (column, NumPy dtype) in file order; payloads are variable length and stored separately in .npz files
+COLUMNS = (
+    ("timestamp", np.int64),
+    ("source", str),           # Message table, CAN or SomeIP
+    ("message_id", str),
+    ("id_num", np.int64),      # -1 when the ID is not hex
+    ("type", str),             # Direction: Rx, Tx or an error type
+    ("length", np.int32),
+    ("value", np.uint64),      # Decoded payload value, see has_value
+    ("has_value", np.bool_),
+    ("session_id", np.int64),  # -1 for rows recorded before sessions existed
+    ("repeat_count", np.int32),
+    ("last_timestamp", np.int64),
+)
+SELECT_COLUMNS = "timestamp, message_id, id_num, type, length, data, session_id, repeat_count, " \
+                 "coalesce(last_timestamp, timestamp)"
+
+def default_format():
+    return "parquet" if pa is not None else "npz"
+
+def path_format(path):
+    """Return the format of a columnar file from its extension, the default one for other extensions"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".npz"):
+        return extension[1:]
+    return default_format()
+
+def iter_chunks(conn, tables, session_id=None, start=None, end=None, chunk_size=EXPORT_CHUNK):
+    """Yield (table, rows) chunks of raw rows in chronological order per table"""
+    for table in tables:
+        conditions = []
+        params = []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        query = f"SELECT {SELECT_COLUMNS} FROM {table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cursor = conn.execute(query + " ORDER BY timestamp, rowid", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield table, rows
+
+def to_columns(table, rows):
+    """Convert raw rows to ({column: array}, [payload bytes])"""
+    timestamps, message_ids, id_nums, types, lengths, payloads, sessions, repeats, lasts = zip(*rows)
+    values = [payload_value(payload) for payload in payloads]
+    columns = {
+        "timestamp": np.array(timestamps, dtype=np.int64),
+        "source": np.array([table] * len(rows)),
+        "message_id": np.array(message_ids),
+        "id_num": np.array([-1 if i is None else i for i in id_nums], dtype=np.int64),
+        "type": np.array(types),
+        "length": np.array([0 if n is None else n for n in lengths], dtype=np.int32),
+        "value": np.array([0 if v is None else v for v in values], dtype=np.uint64),
+        "has_value": np.array([v is not None for v in values], dtype=np.bool_),
+        "session_id": np.array([-1 if s is None else s for s in sessions], dtype=np.int64),
+        "repeat_count": np.array(repeats, dtype=np.int32),
+        "last_timestamp": np.array(lasts, dtype=np.int64),
+    }
+    return columns, [bytes(payload or b"") for payload in payloads]
+
+def export_messages(conn, path, tables, fmt=None, **filters):
+    """Stream the message tables to a columnar file and return the number of rows written"""
+    fmt = fmt or path_format(path)
+    if fmt == "parquet":
+        return export_parquet(conn, path, tables, **filters)
+    if fmt == "npz":
+        return export_npz(conn, path, tables, **filters)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+def export_parquet(conn, path, tables, **filters):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow")
+    # Nullable columns replace the -1 / has_value sentinels of the .npz layout
+    schema = pa.schema([("timestamp", pa.int64()), ("source", pa.string()), ("message_id", pa.string()),
+                        ("id_num", pa.int64()), ("type", pa.string()), ("length", pa.int32()),
+                        ("value", pa.uint64()), ("payload", pa.binary()), ("session_id", pa.int64()),
+                        ("repeat_count", pa.int32()), ("last_timestamp", pa.int64())])
+    written = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for table, rows in iter_chunks(conn, tables, **filters):
+            columns, payloads = to_columns(table, rows)
+            arrays = {name: columns[name] for name, _dtype in COLUMNS if name != "has_value"}
+            arrays["id_num"] = pa.array(arrays["id_num"], mask=arrays["id_num"] < 0)
+            arrays["value"] = pa.array(arrays["value"], mask=~columns["has_value"])
+            arrays["session_id"] = pa.array(arrays["session_id"], mask=arrays["session_id"] < 0)
+            arrays["payload"] = pa.array(payloads, type=pa.binary())
+            writer.write_table(pa.table(arrays, schema=schema))
+            written += len(rows)
+    return written
+
+def export_npz(conn, path, tables, **filters):
+    # savez cannot append, chunks are kept as typed arrays (not Python rows) until the end
+    parts = {name: [] for name, _dtype in COLUMNS}
+    payload_parts = []
+    sizes = []
+    for table, rows in iter_chunks(conn, tables, **filters):
+        columns, payloads = to_columns(table, rows)
+        for name, values in columns.items():
+            parts[name].append(values)
+        payload_parts.append(b"".join(payloads))
+        sizes.extend(len(payload) for payload in payloads)
+    arrays = {}
+    for name, dtype in COLUMNS:
+        if parts[name]:
+            arrays[name] = np.concatenate(parts[name])
+        else:
+            arrays[name] = np.array([], dtype=dtype if dtype is not str else "U1")
+    # Payload i is payload[payload_offsets[i]:payload_offsets[i + 1]]
+    arrays["payload"] = np.frombuffer(b"".join(payload_parts), dtype=np.uint8)
+    arrays["payload_offsets"] = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+    # Through a file object, savez would append .npz to other paths
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    return len(sizes)
+
+def iter_file_rows(path, chunk_size=EXPORT_CHUNK):
+    """Yield (source, rows) chunks of an exported file with rows in the database insert layout"""
+    if path_format(path) == "parquet":
+        if pa is None:
+            raise RuntimeError("Parquet import needs pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            columns = batch.to_pydict()
+            yield from group_rows(columns["source"], zip(
+                columns["timestamp"], columns["message_id"], columns["id_num"], columns["payload"],
+                columns["type"], columns["length"], columns["session_id"], columns["repeat_count"],
+                columns["last_timestamp"]))
+        return
+    with np.load(path) as data:
+        # Every access to data[name] decompresses the whole member, read each one once
+        arrays = {name: data[name] for name, _dtype in COLUMNS}
+        offsets = data["payload_offsets"]
+        payload = data["payload"].tobytes()
+        count = len(arrays["timestamp"])
+        for low in range(0, count, chunk_size):
+            high = min(low + chunk_size, count)
+            columns = {name: values[low:high].tolist() for name, values in arrays.items()}
+            payloads = [payload[offsets[i]:offsets[i + 1]] for i in range(low, high)]
+            yield from group_rows(columns["source"], zip(
+                columns["timestamp"], columns["message_id"],
+                [None if i < 0 else i for i in columns["id_num"]], payloads, columns["type"], columns["length"],
+                [None if s < 0 else s for s in columns["session_id"]], columns["repeat_count"],
+                columns["last_timestamp"]))
+
+def group_rows(sources, rows):
+    """Split one chunk into (source, rows) runs, exports hold one table after the other"""
+    current = None
+    group = []
+    for source, row in zip(sources, rows):
+        if source != current and group:
+            yield current, group
+            group = []
+        current = source
+        group.append(row)
+    if group:
+        yield current, group
+
+def import_messages(conn, path, tables, session_id):
+    """Bulk insert an exported file into the message tables under session_id, return the row count
+
+    Runs in one transaction with the rollups of the imported rows.
+    """
+    columns = ("timestamp", "message_id", "id_num", "data", "type", "length", "session_id",
+               "repeat_count", "last_timestamp")
+    imported = 0
+    with conn:
+        for source, rows in iter_file_rows(path):
+            if source not in tables:
+                print(f"Skipping {len(rows)} rows of unknown table {source}")
+                continue
+            rows = [(*row[:6], session_id, *row[7:]) for row in rows]
+            conn.executemany(f"INSERT INTO {source} ({', '.join(columns)}) "
+                             f"VALUES ({', '.join('?' * len(columns))})", rows)
+            # (timestamp, message_id, type, payload, repeat_count, last_timestamp)
+            write_rollups(conn, {source: list(expand_runs((row[0], row[1], row[4], row[3], row[7], row[8])
+                                                          for row in rows))})
+            imported += len(rows)
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import recorded messages as columnar files")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="Columnar file, .parquet or .npz")
+    parser.add_argument("--db", default="messages.db", help="Message database")
+    parser.add_argument("--session", type=int, default=None, help="Export only this session")
+    parser.add_argument("--start", type=int, default=None, help="First timestamp to export (ns)")
+    parser.add_argument("--end", type=int, default=None, help="Timestamp to stop the export at (ns)")
+    args = parser.parse_args()
+
+    from database import Database, MESSAGE_TABLES
+    if args.command == "export":
+        # A read-only connection can export while the client keeps recording
+        conn = open_reader(args.db)
+        try:
+            count = export_messages(conn, args.path, MESSAGE_TABLES, session_id=args.session,
+                                    start=args.start, end=args.end)
+        finally:
+            conn.close()
+        print(f"Exported {count} messages to {args.path}")
+    else:
+        db = Database(args.db, session_label=f"import {os.path.basename(args.path)}")
+        try:
+            count = db.import_messages(args.path, session_id=db.session_id)
+        except Exception:
+            # Nothing was imported, the session opened for the import goes too
+            db.delete_session(db.session_id)
+            raise
+        finally:
+            db.close()
+        print(f"Imported {count} messages from {args.path}")
+
+if __name__ == "__main__":
+    main()
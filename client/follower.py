@@ -0,0 +1,59 @@
+# Viewer side of the headless gateway: shows the messages the daemon records, polled from its database
+from itertools import islice
+from PyQt6.QtCore import QObject, QTimer
+
+FOLLOW_INTERVAL_MS = 250  # Poll period of the database
+FOLLOW_BATCH = 5000       # Rows shown per poll at most, a backlog is caught up over the next polls
+
+class DatabaseFollower(QObject):
+    """Feeds rows appended by another process to the tabs as if they had been received here"""
+    def __init__(self, database, queries, can_tab, someip_tab, parent=None):
+        super().__init__(parent)
+        self.database = database
+        self.queries = queries
+        self.tabs = {"CAN": can_tab, "SomeIP": someip_tab}
+        self.key = "follow_database"
+        # Per table (timestamp, rowid) of the newest row shown, None until the tabs loaded their history
+        self.cursors = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(FOLLOW_INTERVAL_MS)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def poll(self):
+        # One poll at a time, a slow query delays the next one instead of piling up
+        if self.queries.is_pending(self.key):
+            return
+        if self.cursors is None:
+            # Rows recorded after the pages the tabs loaded are shown, none missed, none twice
+            if not all(tab.history_loaded for tab in self.tabs.values()):
+                return
+            self.cursors = {table: tab.newest_key for table, tab in self.tabs.items() if tab.newest_key is not None}
+        self.queries.submit(fetch_appended, self.database, self.cursors, key=self.key, callback=self.show_rows)
+
+    def show_rows(self, result):
+        cursors, session_id, rows = result
+        self.cursors = cursors
+        # The daemon starts a new session when it restarts, "current session" follows it
+        self.database.session_id = session_id
+        for timestamp, source, message_id, data, length, table, rowid in rows:
+            msg_type = source.split(" ", 1)[1]
+            self.tabs[table].show_message(timestamp, message_id, bytes(data or b""), msg_type, length)
+
+def fetch_appended(database, cursors):
+    """Return (cursors, newest session, rows appended after cursors), runs on the query worker
+
+    A table without a cursor is followed from its first row.
+    """
+    session_id = database.latest_session()
+    # Compacted runs are followed by their first row, later repeats only update it in place
+    rows = list(islice(database.iter_message_sequence(after=cursors, expand_repeats=False), FOLLOW_BATCH))
+    cursors = dict(cursors)
+    for row in rows:
+        cursors[row[5]] = (row[0], row[6])
+    return cursors, session_id, rows
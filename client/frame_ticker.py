@@ -0,0 +1,34 @@
+# Fixed-rate UI tick: views buffer incoming messages and apply them once per frame,
+# so under bursts the UI cost follows the frame rate instead of the message rate
+from PyQt6.QtCore import QObject, QTimer
+import profiling
+
+UI_REFRESH_HZ = 25  # View updates per second
+
+class FrameTicker(QObject):
+    """Calls every registered flush callback once per frame"""
+    def __init__(self, rate=UI_REFRESH_HZ, parent=None):
+        super().__init__(parent)
+        self.callbacks = []
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / rate))
+        self.timer.timeout.connect(self.tick)
+        self.tracer = None
+
+    def add(self, callback):
+        self.callbacks.append(callback)
+
+    def start(self):
+        # Profiling is configured before the window exists
+        self.tracer = profiling.get_tracer("ui_tick")
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def tick(self):
+        tracer = self.tracer
+        if tracer: tracer.begin()
+        for callback in self.callbacks:
+            callback()
+            if tracer: tracer.phase(getattr(callback, "__qualname__", "flush"))
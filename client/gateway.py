@@ -0,0 +1,229 @@
+# Qt-free CAN <-> SOME/IP forwarding core, shared by the GUI listener and the headless daemon
+# Both directions run on one asyncio event loop woken by the CAN and UDP sockets, no polling timeouts
+# Which messages are forwarded where is decided by a RoutingTable, see routing.py
+# Payloads are reported as bytes, hex is only formatted by the views that show them
+import asyncio
+import socket
+import struct
+import can
+from routing import load_routes
+import profiling
+
+SERVER_IP = "192.168.1.26"
+SERVER_PORT = 30490
+LISTEN_PORT = 30491      # Port to listen for incoming SomeIP messages
+SOMEIP_HEADER_SIZE = 16  # Minimum SomeIP header size
+SOMEIP_HEADER = struct.Struct("!HHHHBBBBI")
+RECV_BUFFER_SIZE = 65535  # Largest UDP datagram, the receive buffer is allocated once
+
+def decode_someip(datagram):
+    """Return (service_id, method_id, payload) of a SOME/IP datagram, None if it is too short
+
+    The payload is a slice of datagram, a view without copy when datagram is a memoryview.
+    """
+    if len(datagram) < SOMEIP_HEADER_SIZE:
+        return None
+    service_id, method_id, client_id, session_id, \
+    protocol_version, interface_version, message_type, \
+    return_code, payload_length = SOMEIP_HEADER.unpack_from(datagram)
+    return service_id, method_id, datagram[SOMEIP_HEADER_SIZE:SOMEIP_HEADER_SIZE + payload_length]
+
+class CanForwarder:
+    """Forwards the routed frames of the CAN bus to the SOME/IP server
+
+    on_can(message_id, data) reports every forwarded CAN frame and
+    on_someip(someip_id, data) every SOME/IP message sent for it, data as a bytearray.
+    """
+    def __init__(self, routes, on_can=None, on_someip=None, server=(SERVER_IP, SERVER_PORT)):
+        self.routes = routes
+        self.on_can = on_can
+        self.on_someip = on_someip
+        self.server = server
+
+    def forward(self, message, transport, tracer=None):
+        route = self.routes.can.get(message.arbitration_id)
+        if route is None:
+            # Not routed, e.g. the frames the gateway itself sends for SOME/IP messages
+            self.routes.unrouted_can += 1
+            return
+        data = message.data  # Owned by the message, passed on without copy
+        if self.on_can:
+            self.on_can(route.can_id_hex, data)  # Update CAN tab
+        if tracer: tracer.phase("emit")
+
+        # Create SomeIP message with the actual CAN data
+        someip_message = route.encode(message.data)
+        if tracer: tracer.phase("encode")
+        # Send to original destination, the transport buffers instead of blocking the loop
+        transport.sendto(someip_message, self.server)
+        if tracer: tracer.phase("send")
+
+        if self.on_someip:
+            self.on_someip(route.someip_id, data)  # Update SomeIP tab
+        if tracer: tracer.phase("emit")
+
+class SomeIPForwarder:
+    """Forwards the payload of routed SOME/IP datagrams to the CAN bus
+
+    on_someip(someip_id, payload) reports every received message as bytes and
+    on_can(message_id, data, msg_type) every frame the bus accepted, data as a bytearray.
+    """
+    def __init__(self, routes, transmit, on_someip=None, on_can=None):
+        self.routes = routes
+        # transmit(message, done) sends or queues a can.Message, done(error) may run on another thread
+        self.transmit = transmit
+        self.on_someip = on_someip
+        self.on_can = on_can
+        # Datagrams are received into one reusable buffer and parsed through memoryview slices
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        # Per-phase timing hooks, None unless profiling was enabled
+        self.tracer = profiling.get_tracer("someip_listener")
+
+    def read(self, sock):
+        """Forward every datagram waiting on the non-blocking socket, called when it is readable"""
+        tracer = self.tracer
+        while True:
+            try:
+                if tracer: tracer.begin()
+                size, addr = sock.recvfrom_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"Error in SomeIP listener: {e}")
+                return
+            # Both directions share the loop thread, nothing raised here may escape to it
+            try:
+                if tracer: tracer.phase("recv")
+                self.forward(self.view[:size], tracer)
+            except Exception as e:
+                print(f"Error in SomeIP listener: {e}")
+
+    def forward(self, datagram, tracer=None):
+        decoded = decode_someip(datagram)
+        if decoded is None:
+            return
+        service_id, method_id, payload = decoded
+        route = self.routes.route_someip(service_id, method_id)
+        if route is None:
+            return
+        # The only copy out of the receive buffer; the raw transform returns it unchanged
+        payload = bytes(payload)
+        if tracer: tracer.phase("parse")
+
+        # Report the SomeIP message
+        someip_info = f"{hex(service_id)}{method_id}"
+        if self.on_someip:
+            self.on_someip(someip_info, payload)
+        if tracer: tracer.phase("emit")
+
+        try:
+            # Send to CAN bus, the frame is reported once the bus accepted it
+            msg = can.Message(arbitration_id=route.can_id, data=route.transform(payload), is_extended_id=False)
+            loop = asyncio.get_running_loop()
+            self.transmit(msg, lambda error: self.report_sent(loop, route, msg, error))
+            if tracer: tracer.phase("can_send")
+        except Exception as e:
+            print(f"Error forwarding to CAN: {e}")
+
+    def report_sent(self, loop, route, msg, error):
+        """Pass the result of a send back to the loop thread, called from the transmit thread"""
+        try:
+            loop.call_soon_threadsafe(self.sent, route, msg, error)
+        except RuntimeError:
+            pass  # The gateway stopped, the frames still queued are not reported
+
+    def sent(self, route, msg, error):
+        if error is not None:
+            print(f"Error forwarding to CAN: {error}")
+            return
+        try:
+            if self.on_can:
+                self.on_can(route.can_id_hex, msg.data, "Tx")
+        except Exception as e:
+            print(f"Error forwarding to CAN: {e}")
+
+class Gateway:
+    """Runs both forwarding directions on one asyncio event loop
+
+    Callbacks are called on the loop thread: on_can_received and on_someip_sent for
+    CAN -> SOME/IP, on_someip_received and on_can_sent for SOME/IP -> CAN.
+    """
+    def __init__(self, bus, on_can_received=None, on_someip_sent=None, on_someip_received=None,
+                 on_can_sent=None, listen_port=LISTEN_PORT, server=(SERVER_IP, SERVER_PORT), routes=None,
+                 can_filters=True, transmit=None):
+        self.bus = bus
+        self.listen_port = listen_port
+        self.routes = routes or load_routes()
+        if can_filters:
+            # Unrouted frames are dropped by the kernel instead of waking the loop
+            bus.set_filters(self.routes.can_filters())
+        self.can_forwarder = CanForwarder(self.routes, on_can_received, on_someip_sent, server)
+        # Frames go through the transmit queue of a SharedBus when one is given, bus.send otherwise
+        self.someip_forwarder = SomeIPForwarder(self.routes, transmit or self.send_now, on_someip_received, on_can_sent)
+        self.loop = None
+        self.stopped = None
+        self.stopping = False  # stop() may be called before serve() created its loop
+
+    def run(self):
+        """Forward until stop() is called, blocking the calling thread"""
+        asyncio.run(self.serve())
+
+    async def serve(self, *tasks):
+        """Forward until stop() is called, running the extra coroutines `tasks` alongside"""
+        # The Event exists before the loop is published, stop() from another thread uses both
+        self.stopped = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.stopping:
+            self.stopped.set()
+        # The Notifier watches the bus socket with loop.add_reader (a thread for buses without a fileno)
+        reader = can.AsyncBufferedReader()
+        notifier = can.Notifier(self.bus, [reader], loop=self.loop)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(("0.0.0.0", self.listen_port))
+        listener.setblocking(False)
+        self.loop.add_reader(listener, self.someip_forwarder.read, listener)
+        sender, _protocol = await self.loop.create_datagram_endpoint(asyncio.DatagramProtocol,
+                                                                     local_addr=("0.0.0.0", 0))
+        running = [asyncio.create_task(self.forward_can(reader, sender))]
+        running.extend(asyncio.create_task(task) for task in tasks)
+        try:
+            await self.stopped.wait()
+        finally:
+            # Cancelling wakes the tasks at once, there is no receive timeout to wait for
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            notifier.stop()
+            self.loop.remove_reader(listener)
+            listener.close()
+            sender.close()
+
+    def send_now(self, message, done):
+        """Send a frame on the loop thread, the transmit of gateways without a SharedBus"""
+        try:
+            self.bus.send(message)
+        except can.CanError as e:
+            done(e)
+            return
+        done(None)
+
+    async def forward_can(self, reader, transport):
+        # Per-phase timing hooks, None unless profiling was enabled
+        tracer = profiling.get_tracer("can_listener")
+        async for message in reader:
+            try:
+                if tracer: tracer.begin()
+                self.can_forwarder.forward(message, transport, tracer)
+            except Exception as e:
+                print(f"Error in CAN listener: {e}")
+
+    def stop(self):
+        """Stop serve(), callable from any thread"""
+        self.stopping = True
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self.stopped.set)
+            except RuntimeError:
+                pass  # The loop finished in the meantime
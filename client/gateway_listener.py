@@ -0,0 +1,31 @@
+# GUI side of the gateway core: the asyncio forwarding loop on one QThread, messages reported as signals
+from PyQt6.QtCore import QThread, pyqtSignal
+from gateway import Gateway, LISTEN_PORT
+import bus_manager
+
+class GatewayListener(QThread):
+    """Forwards CAN <-> SOME/IP in both directions from a single thread"""
+    # Payloads are bytes objects, the views format them as hex only when painted
+    new_can_message = pyqtSignal(str, object)  # Received CAN frames, for updating CAN Tab
+    new_someip_tx = pyqtSignal(str, object)  # SomeIP messages sent for them, for updating SomeIP Tab
+    new_someip_message = pyqtSignal(str, object)  # Received SomeIP messages, for updating SomeIP Tab
+    new_can_tx = pyqtSignal(str, object, str)  # CAN frames sent for them, for updating CAN Tab
+
+    def __init__(self, channel="vcan0", bustype="socketcan", listen_port=LISTEN_PORT, routes=None):
+        super().__init__()
+        self.channel = channel
+        self.bustype = bustype
+        # Shared with send_can_message, frames sent from the CAN tab use the same socket
+        self.shared_bus = bus_manager.acquire(self.channel, self.bustype)
+        self.gateway = Gateway(self.shared_bus.bus, transmit=self.shared_bus.send, on_can_received=self.new_can_message.emit,
+                               on_someip_sent=self.new_someip_tx.emit,
+                               on_someip_received=self.new_someip_message.emit,
+                               on_can_sent=self.new_can_tx.emit, listen_port=listen_port, routes=routes)
+
+    def run(self):
+        self.gateway.run()
+
+    def stop(self):
+        self.gateway.stop()
+        self.wait()
+        bus_manager.release(self.shared_bus)
@@ -3,39 +3,31 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QCheckBox,
     QComboBox, QToolTip
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QCursor
 import pyqtgraph as pg
 import datetime
 import time
-from pyqtgraph import ScatterPlotItem
-from PyQt5 import QtWidgets
 from pyqtgraph.graphicsItems.DateAxisItem import DateAxisItem
+from ring_buffer import GRAPH_CAPACITY
+from lod import LodSeries, nearest_index
 
+HOVER_RADIUS = 6  # Pixels between the mouse and a point for its tooltip
 
-class HoverScatter(ScatterPlotItem):
-    def hoverEvent(self, ev):
-        # always call the base implementation to handle highlighting, etc.
-        super().hoverEvent(ev)
 
-        if ev.isExit():
-            QToolTip.hideText()
-        else:
-            # find which spots are under the mouse
-            spots = self.pointsAt(ev.pos())
-            if spots:
-                # show the first spot's data in a tooltip
-                data = spots[0].data()
-                QToolTip.showText(ev.screenPos().toPoint(), str(data))
 class GraphTab(QWidget):
-    def __init__(self, database, someiptab, cantab,*args, **kwargs):
+    def __init__(self, database, someiptab, cantab, *args, capacity=GRAPH_CAPACITY, **kwargs):
         super().__init__(*args, **kwargs)
         self.database = database
         self.someiptab = someiptab
         self.cantab = cantab
         
-        # Data structures to store messages for the current session
-        self.message_sequence = []  # List of (timestamp, type, message_id, data, length)
+        # Bounded (timestamp, value) history per plotted series
+        # with a min/max pyramid so only about one point per pixel is drawn
+        self.temperature = LodSeries(capacity)  # CAN Rx
+        self.fan_speed = LodSeries(capacity)    # SomeIP Rx
         self.message_counter = 0    # Counter for X-axis sequencing
+        self.dirty = False          # Messages arrived since the last replot
         
         self.init_ui()
         
@@ -72,14 +64,29 @@ class GraphTab(QWidget):
         self.plot_widget.getViewBox().setMouseEnabled(x=True,y=False)
         self.plot_widget.addLegend()
         
+        # Persistent plot items, refresh() only replaces their data
+        self.temperature_curve = self.plot_widget.plot([], [], pen='b', symbol='o', symbolPen='b',
+                                                       symbolBrush='b', name="Temperature")
+        self.fan_speed_curve = self.plot_widget.plot([], [], pen='g', symbol='s', symbolPen='g',
+                                                     symbolBrush='g', name="Fan Speed")
+        
+        # Panning, zooming and resizing change the level of detail, redrawn on the next UI frame
+        view_box = self.plot_widget.getViewBox()
+        view_box.sigXRangeChanged.connect(self.mark_dirty)
+        view_box.sigResized.connect(self.mark_dirty)
+        # Fan speed tooltips, looked up by binary search on the timestamps
+        self.plot_widget.scene().sigMouseMoved.connect(self.on_mouse_moved)
+        
         main_layout.addWidget(self.plot_widget)
         self.setLayout(main_layout)
 
     def handle_can_message(self, timestamp, message_id, data, msg_type, data_len):
         """Handle signals from CAN tab"""
 
-        # Convert timestamp string to float (Unix time)
-        if isinstance(timestamp, str):
+        # Convert nanosecond timestamp to float (Unix time)
+        if isinstance(timestamp, int):
+            timestamp = timestamp / 1e9
+        elif isinstance(timestamp, str):
             try:
                 dt = datetime.datetime.strptime(timestamp, "%d-%m-%Y %H:%M:%S")
                 timestamp = dt.timestamp()
@@ -93,21 +100,23 @@ class GraphTab(QWidget):
                 data = int(data, 16)
             except ValueError:
                 data = 0
+        elif isinstance(data, (bytes, bytearray)):
+            data = int.from_bytes(data, "big")
 
-        can_type = "CAN " + msg_type
         self.message_counter += 1
-        self.message_sequence.append((timestamp, can_type, message_id, data, data_len))
-
-        if self.isVisible():
-            self.refresh()
+        if msg_type == "Rx":
+            self.temperature.append(timestamp, data)
+            self.dirty = True
 
 
 
 
     def handle_someip_message(self, timestamp, message_id, data, msg_type, data_len):
         """Handle signals from SomeIP tab"""
-        # Convert timestamp string to float (Unix time)
-        if isinstance(timestamp, str):
+        # Convert nanosecond timestamp to float (Unix time)
+        if isinstance(timestamp, int):
+            timestamp = timestamp / 1e9
+        elif isinstance(timestamp, str):
             try:
                 dt = datetime.datetime.strptime(timestamp, "%d-%m-%Y %H:%M:%S")  # Match your timestamp format
                 timestamp = dt.timestamp()  # Convert to float seconds
@@ -121,55 +130,50 @@ class GraphTab(QWidget):
                 data = int(data)
             except ValueError:
                 data = 0
+        elif isinstance(data, (bytes, bytearray)):
+            data = int.from_bytes(data, "big")
 
         self.message_counter += 1
-        self.message_sequence.append((timestamp, msg_type, message_id, data, data_len))
+        if msg_type == "SomeIP Rx":
+            self.fan_speed.append(timestamp, data)
+            self.dirty = True
 
-        if self.isVisible():
+    def flush_updates(self):
+        """Replot once per UI frame when messages arrived and the graph is shown"""
+        if self.dirty and self.isVisible():
             self.refresh()
 
     def refresh(self):
         """Refresh the graph with current data"""
-        self.plot_widget.clear()
-        self.plot_widget.setYRange(0,150)
-        self.plot_widget.enableAutoRange(axis='y',enable=False)
-        messages = self.message_sequence
-
-        
-        # Prepare data for plotting
-        can_rx_x = []
-        can_rx_y = []
-        someip_rx_x = []
-        someip_rx_y = []
-        
-        for idx, (timestamp, msg_type, msg_id, data, data_len) in enumerate(messages):
-            if msg_type == "CAN Rx":
-                can_rx_x.append(timestamp)
-                can_rx_y.append(data)
-            elif msg_type == "SomeIP Rx":
-                someip_rx_x.append(timestamp)
-                someip_rx_y.append(data)
-
-        
-        # Plot the data with different colors and symbols
-        if can_rx_x:
-            self.plot_widget.plot(can_rx_x, can_rx_y, pen='b', symbol='o', symbolPen='b', 
-                                 symbolBrush='b', name="Temperature")
-        if someip_rx_x:
-            # Add a standard plot item for the legend first
-            self.plot_widget.plot(someip_rx_x, someip_rx_y, pen='g', symbol='s', symbolPen='g',
-                                 symbolBrush='g', name="Fan Speed")
-            
-            # Then add the hover scatter for interactive functionality
-            spots = [
-                {'pos': (x, y), 'data': y, 'brush': 'g'}
-                for x, y in zip(someip_rx_x, someip_rx_y)
-            ]
-            scatter = HoverScatter(spots=spots, symbol='s', size=10)
-            self.plot_widget.addItem(scatter)
+        self.dirty = False
+        # setData on the existing items with the detail the visible range needs, nothing is rebuilt
+        view_box = self.plot_widget.getViewBox()
+        x_min, x_max = view_box.viewRange()[0]
+        width = view_box.width()
+        self.temperature_curve.setData(*self.temperature.visible(x_min, x_max, width))
+        self.fan_speed_curve.setData(*self.fan_speed.visible(x_min, x_max, width))
+
+    def mark_dirty(self, *args):
+        self.dirty = True
+
+    def on_mouse_moved(self, pos):
+        """Show the value of the fan speed point under the mouse"""
+        view_box = self.plot_widget.getViewBox()
+        if not view_box.sceneBoundingRect().contains(pos):
+            return
+        x, y = self.fan_speed.data()
+        index = nearest_index(x, view_box.mapSceneToView(pos).x())
+        if index is None:
+            return
+        spot = view_box.mapViewToScene(QPointF(x[index], y[index]))
+        if abs(spot.x() - pos.x()) <= HOVER_RADIUS and abs(spot.y() - pos.y()) <= HOVER_RADIUS:
+            QToolTip.showText(QCursor.pos(), f"{y[index]:g}")
+        else:
+            QToolTip.hideText()
 
     def clear_graph(self):
         """Clear all data points from the graph"""
-        self.message_sequence = []
+        self.temperature.clear()
+        self.fan_speed.clear()
         self.message_counter = 0
-        self.plot_widget.clear()
+        self.refresh()
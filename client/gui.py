@@ -1,13 +1,15 @@
 from PyQt6.QtWidgets import QMainWindow, QTabWidget
-from can_module import CANListener
-from someip_module import SomeIPListener
+from gateway_listener import GatewayListener
 from can_tab import CANTab
 from someip_tab import SomeIPTab
 from monitor_tab import MonitorTab 
 from graph_tab import GraphTab  # Import the new GraphTab
+from frame_ticker import FrameTicker
+from query_service import QueryService
+from follower import DatabaseFollower
 
 class SupervisionUI(QMainWindow):
-    def __init__(self, database):
+    def __init__(self, database, attach=False, routes=None):
         super().__init__()
         self.database = database
         
@@ -19,14 +21,17 @@ class SupervisionUI(QMainWindow):
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
         
+        # Database queries run on a worker thread shared by the tabs
+        self.queries = QueryService(self.database, self)
+        
         # Initialize tabs
-        self.can_tab = CANTab(self.database)
+        self.can_tab = CANTab(self.database, self.queries)
         self.tabs.addTab(self.can_tab, "CAN")
     
-        self.someip_tab = SomeIPTab(self.database)
+        self.someip_tab = SomeIPTab(self.database, self.queries)
         self.tabs.addTab(self.someip_tab, "SomeIP")
         
-        self.monitor_tab = MonitorTab(self.database, self.someip_tab, self.can_tab)
+        self.monitor_tab = MonitorTab(self.database, self.someip_tab, self.can_tab, self.queries)
         self.tabs.addTab(self.monitor_tab, "Monitoring")
         
         # Add the new Graph tab
@@ -37,23 +42,33 @@ class SupervisionUI(QMainWindow):
         self.can_tab.load_saved_messages()
         self.someip_tab.load_saved_messages()
         
-        # Start CAN listener
-        self.can_listener = CANListener()
-        self.can_listener.new_can_message.connect(self.can_tab.receive_can_message)
-        self.can_listener.new_someip_message.connect(self.someip_tab.send_someip_message)
-        self.can_listener.start()
-        
-        # Start SomeIP listener
-        self.someip_listener = SomeIPListener()
-        self.someip_listener.new_someip_message.connect(self.someip_tab.receive_someip_message)
-        self.someip_listener.new_can_message.connect(self.can_tab.receive_can_message)
-        self.someip_listener.start()
+        self.listeners = []
+        self.follower = None
+        if attach:
+            # The gateway daemon owns the bus and the sockets, show what it records. The viewer
+            # neither sends test messages (it would record them next to the daemon's) nor clears its recordings.
+            self.can_tab.can_send_button.setEnabled(False)
+            self.someip_tab.someip_send_button.setEnabled(False)
+            self.monitor_tab.clear_button.setEnabled(False)
+            self.follower = DatabaseFollower(self.database, self.queries, self.can_tab, self.someip_tab, self)
+            self.follower.start()
+        else:
+            # Start the gateway, both forwarding directions on one thread
+            self.gateway_listener = GatewayListener(routes=routes)
+            self.gateway_listener.new_can_message.connect(self.can_tab.receive_can_message)
+            self.gateway_listener.new_someip_tx.connect(self.someip_tab.send_someip_message)
+            self.gateway_listener.new_someip_message.connect(self.someip_tab.receive_someip_message)
+            self.gateway_listener.new_can_tx.connect(self.can_tab.receive_can_message)
+            self.gateway_listener.start()
+            self.listeners = [self.gateway_listener]
         
         self.tabs.currentChanged.connect(self.on_tab_changed)
         
-        # Connect signals to refresh graph when new messages arrive
-        self.can_listener.new_can_message.connect(self.refresh_graph_if_visible)
-        self.someip_listener.new_someip_message.connect(self.refresh_graph_if_visible)
+        # Incoming messages are buffered by the tabs and shown once per UI frame
+        self.ticker = FrameTicker(parent=self)
+        for tab in (self.can_tab, self.someip_tab, self.monitor_tab, self.graph_tab):
+            self.ticker.add(tab.flush_updates)
+        self.ticker.start()
     
     def refresh_monitor_if_visible(self, *args):
         """Refresh monitor tab if it's currently visible"""
@@ -77,7 +92,11 @@ class SupervisionUI(QMainWindow):
             
     def closeEvent(self, event):
         """Handle window close event"""
-        self.can_listener.stop()
-        self.someip_listener.stop()  # Stop the SomeIP listener
+        self.ticker.stop()
+        if self.follower:
+            self.follower.stop()
+        for listener in self.listeners:
+            listener.stop()
+        self.queries.shutdown()
         self.database.close()
         event.accept()
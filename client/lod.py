@@ -0,0 +1,110 @@
+# Level of detail for long graph histories: a min/max pyramid over a RingBuffer
+# so a redraw costs about the number of horizontal pixels, not the number of samples
+import numpy as np
+from ring_buffer import RingBuffer
+
+LOD_FACTOR = 4  # Samples per block grow by this factor from one pyramid level to the next
+
+class MinMaxLevel:
+    """Per-block (first x, min y, max y) of one pyramid level, a ring like RingBuffer's samples"""
+    def __init__(self, block, capacity):
+        self.block = block
+        self.blocks = capacity // block
+        self.x = np.zeros(2 * self.blocks)
+        self.low = np.zeros(2 * self.blocks)
+        self.high = np.zeros(2 * self.blocks)
+
+    def add(self, index, x, y):
+        """Fold sample number `index` (counted since the last clear) into its block"""
+        slot = (index // self.block) % self.blocks
+        twin = slot + self.blocks
+        if index % self.block == 0:
+            # First sample of a block reuses the slot of the block that just left the ring
+            self.x[slot] = self.x[twin] = x
+            self.low[slot] = self.low[twin] = y
+            self.high[slot] = self.high[twin] = y
+        elif y < self.low[slot]:
+            self.low[slot] = self.low[twin] = y
+        elif y > self.high[slot]:
+            self.high[slot] = self.high[twin] = y
+
+    def points(self, first, last, oldest):
+        """Return (x, y) with a min and a max point per block for samples first..last (absolute)
+
+        oldest is the absolute index of the oldest sample still in the ring; its block is
+        skipped when partly overwritten, as its slot already holds a newer block.
+        """
+        block = first // self.block
+        if block * self.block < oldest:
+            block += 1
+        start = block % self.blocks
+        count = last // self.block - block + 1
+        x = np.repeat(self.x[start:start + count], 2)
+        y = np.empty(2 * count)
+        y[0::2] = self.low[start:start + count]
+        y[1::2] = self.high[start:start + count]
+        return x, y
+
+class LodSeries:
+    """Time-ordered (x, y) samples that can be read back decimated to a pixel width"""
+    def __init__(self, capacity):
+        self.samples = RingBuffer(capacity)
+        self.count = 0  # Samples appended since the last clear, the absolute index of the next one
+        self.levels = []
+        block = LOD_FACTOR
+        # Blocks must tile the ring exactly so a block slot is reused when its samples are overwritten
+        while block < capacity and capacity % block == 0:
+            self.levels.append(MinMaxLevel(block, capacity))
+            block *= LOD_FACTOR
+
+    def __len__(self):
+        return len(self.samples)
+
+    def append(self, x, y):
+        self.samples.append(x, y)
+        for level in self.levels:
+            level.add(self.count, x, y)
+        self.count += 1
+
+    def clear(self):
+        self.samples.clear()
+        self.count = 0
+
+    def data(self):
+        return self.samples.data()
+
+    def visible(self, x_min, x_max, width):
+        """Return (x, y) covering [x_min, x_max] with at most about 2 * width points
+
+        Samples just outside the range are included so lines run to the edges. When no
+        sample falls in the range the whole history is returned, decimated the same way.
+        """
+        x, y = self.samples.data()
+        if len(x) == 0:
+            return x, y
+        first = max(int(np.searchsorted(x, x_min, "left")) - 1, 0)
+        last = min(int(np.searchsorted(x, x_max, "right")), len(x) - 1)
+        if first >= last:
+            first, last = 0, len(x) - 1
+        width = max(int(width), 1)
+        if last - first + 1 <= 2 * width:
+            return x[first:last + 1], y[first:last + 1]
+        if not self.levels:
+            return x[first:last + 1], y[first:last + 1]
+        # Finest level with at most one block per pixel, the coarsest one for very long ranges
+        offset = self.count - len(x)  # Absolute index of x[0]
+        for level in self.levels:
+            if (last - first) // level.block + 1 <= width:
+                break
+        return level.points(offset + first, offset + last, offset)
+
+def nearest_index(x, value):
+    """Index of the sample of sorted x closest to value, or None if x is empty"""
+    if len(x) == 0:
+        return None
+    i = int(np.searchsorted(x, value))
+    if i == len(x):
+        return i - 1
+    if i > 0 and value - x[i - 1] <= x[i] - value:
+        return i - 1
+    return i
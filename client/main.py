@@ -1,16 +1,34 @@
 import sys
+import argparse
 from PyQt6.QtWidgets import QApplication
-from database import Database
+import database_options
+import routing
 from gui import SupervisionUI
+import profiling
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Automotive HMI")
+    profiling.add_arguments(parser)
+    database_options.add_arguments(parser)
+    routing.add_arguments(parser)
+    parser.add_argument("--attach", action="store_true",
+                        help="View the database recorded by a running gateway daemon instead of forwarding")
+    # Unknown arguments are left for Qt
+    args, qt_args = parser.parse_known_args()
+    if args.attach and args.in_memory:
+        parser.error("--in-memory cannot be combined with --attach, the viewer would overwrite the recorder's file")
+    if args.attach and (args.retention_days is not None or args.max_rows is not None or args.max_size_mb is not None):
+        print("Retention options are ignored with --attach, the gateway daemon applies them")
+    profiling.configure(args)
+    routes = routing.load_routes(args.routes)
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Initialize database
-    db = Database()
+    db = database_options.open_database(args, attach=args.attach)
     
     # Create and show main window
-    window = SupervisionUI(db)
+    window = SupervisionUI(db, attach=args.attach, routes=routes)
     window.show()
     
     sys.exit(app.exec())
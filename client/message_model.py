@@ -0,0 +1,160 @@
+# Shared table model for the CAN, SomeIP and Monitoring message views
+from array import array
+from bisect import bisect_right
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtWidgets import QTableView, QHeaderView
+from database import format_timestamp
+
+HEADERS = ["Timestamp", "Message ID", "Data (Hex)", "Length (Bytes)", "Type"]
+ROW_HEIGHT = 22  # Fixed row height, the view never measures rows
+
+class MessageTableModel(QAbstractTableModel):
+    """Messages kept as parallel columns, cells are formatted only when the view paints them"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timestamps = array("q")  # Nanosecond epoch timestamps
+        self.message_ids = []
+        self.payloads = []            # Raw bytes or the string received
+        self.lengths = array("l")
+        self.types = []
+        # Rows received since the last frame, applied together by apply_pending()
+        self.pending = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.timestamps)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        if column == 0:
+            return format_timestamp(self.timestamps[row])
+        if column == 1:
+            return str(self.message_ids[row])
+        if column == 2:
+            payload = self.payloads[row]
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                return payload.hex()
+            return str(payload)
+        if column == 3:
+            return str(self.lengths[row])
+        return str(self.types[row])
+
+    def append(self, timestamp, message_id, payload, length, msg_type):
+        """Append one message, amortized O(1)"""
+        self.append_rows([(timestamp, message_id, payload, length, msg_type)])
+
+    def append_rows(self, rows):
+        """Append (timestamp, message_id, payload, length, type) rows with a single insert notification"""
+        if not rows:
+            return
+        first = len(self.timestamps)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.extend(rows)
+        self.endInsertRows()
+
+    def queue(self, timestamp, message_id, payload, length, msg_type):
+        """Buffer one message until the next apply_pending() call"""
+        self.pending.append((timestamp, message_id, payload, length, msg_type))
+
+    def apply_pending(self):
+        """Append the buffered messages as one insert and return how many there were"""
+        rows = self.pending
+        if not rows:
+            return 0
+        self.pending = []
+        self.append_rows(rows)
+        return len(rows)
+
+    def prepend_rows(self, rows):
+        """Insert chronological rows before the oldest one shown, for pages loaded while scrolling back"""
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        timestamps, message_ids, payloads, lengths, types = zip(*rows)
+        self.timestamps[0:0] = array("q", timestamps)
+        self.message_ids[0:0] = message_ids
+        self.payloads[0:0] = payloads
+        self.lengths[0:0] = array("l", lengths)
+        self.types[0:0] = types
+        self.endInsertRows()
+
+    def replace(self, rows, since):
+        """Show chronological rows instead of the current ones, keeping rows received after them
+
+        Rows appended while the replacement was queried (newer than `since`, the request time,
+        and than its last row) stay, so a slow query does not lose live messages. Older rows
+        go, a replacement with another filter must not keep the rows of the previous one.
+        """
+        boundary = max(since, rows[-1][0]) if rows else since
+        first = bisect_right(self.timestamps, boundary)
+        newer = list(zip(self.timestamps[first:], self.message_ids[first:], self.payloads[first:],
+                         self.lengths[first:], self.types[first:]))
+        pending = [row for row in self.pending if row[0] > boundary]
+        self.beginResetModel()
+        self.timestamps = array("q")
+        self.message_ids = []
+        self.payloads = []
+        self.lengths = array("l")
+        self.types = []
+        self.extend(rows)
+        self.extend(newer)
+        self.pending = pending
+        self.endResetModel()
+
+    def extend(self, rows):
+        for timestamp, message_id, payload, length, msg_type in rows:
+            self.timestamps.append(timestamp)
+            self.message_ids.append(message_id)
+            self.payloads.append(payload)
+            self.lengths.append(length)
+            self.types.append(msg_type)
+
+    def clear(self):
+        # Buffered rows are already queued for the database and come back with the next load
+        self.pending = []
+        self.beginResetModel()
+        self.timestamps = array("q")
+        self.message_ids = []
+        self.payloads = []
+        self.lengths = array("l")
+        self.types = []
+        self.endResetModel()
+
+def message_length(data, data_len=None):
+    """Return data_len, or the payload length in bytes of bytes or a hex string"""
+    if data_len is not None:
+        return data_len
+    if isinstance(data, str):
+        try:
+            return len(bytes.fromhex(data.replace(" ", "")))
+        except ValueError:
+            return len(data)
+    return len(data)
+
+def create_message_view(model, type_width=100):
+    """Return a QTableView on model sized like the former QTableWidget tables"""
+    view = QTableView()
+    view.setModel(model)
+    # Fixed row heights and no row number header (sized from every row) keep layout to the visible rows
+    view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+    view.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+    view.verticalHeader().hide()
+    view.setWordWrap(False)
+
+    # Set column widths to accommodate full timestamp
+    view.setColumnWidth(0, 180)  # Timestamp column wider
+    view.setColumnWidth(1, 100)  # Message ID
+    view.setColumnWidth(2, 150)  # Data
+    view.setColumnWidth(3, 150)  # Length
+    view.setColumnWidth(4, type_width)  # Type
+    return view
@@ -1,17 +1,36 @@
 # Monitor Tab Update (without graph)
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QComboBox, QCheckBox
 )
 from PyQt6.QtCore import Qt
+from itertools import islice
+from message_model import MessageTableModel, create_message_view, message_length
+from query_service import QueryService
+from database import PAGE_SIZE, MESSAGE_TABLES
+import time
 
 class MonitorTab(QWidget):
-    def __init__(self, database, someiptab, cantab):
+    def __init__(self, database, someiptab, cantab, queries=None):
         super().__init__()
         self.database = database
+        # Sequence loads run on the query worker, one at a time per tab
+        self.queries = queries or QueryService(database, self)
+        self.load_key = "monitor_sequence"
+        # Clearing has its own key, a page load must not supersede it
+        self.clear_key = "monitor_clear"
         self.someiptab = someiptab
         self.cantab = cantab
         self.session_only = True  # Default to showing only current session
+        
+        # Per table (timestamp, rowid) keys of the newest and oldest database rows shown,
+        # refresh() continues from the newest ones, scrolling back from the oldest ones
+        self.newest_keys = {}
+        self.oldest_keys = {}
+        self.has_older = False
+        # Timestamp of the last message per table shown live from the tab signals, every row the
+        # tabs record goes through their message_received signal (show_message)
+        self.live_until = {}
         self.init_ui()
         
         # Connect signals from CAN and SomeIP tabs
@@ -25,25 +44,29 @@ class MonitorTab(QWidget):
         top_control_layout = QHBoxLayout()
         
         # Clear button
-        clear_btn = QPushButton("Clear Database")
-        clear_btn.clicked.connect(self.delete_database)
-        top_control_layout.addWidget(clear_btn)
+        self.clear_button = QPushButton("Clear Database")
+        self.clear_button.clicked.connect(self.delete_database)
+        top_control_layout.addWidget(self.clear_button)
+        
+        # Session filter
+        self.session_checkbox = QCheckBox("Current session only")
+        self.session_checkbox.setChecked(self.session_only)
+        self.session_checkbox.toggled.connect(self.set_session_only)
+        top_control_layout.addWidget(self.session_checkbox)
+        
+        # Loading state of the queries running in the background
+        self.status_label = QLabel("")
+        top_control_layout.addWidget(self.status_label)
         
         main_layout.addLayout(top_control_layout)
         
         # Message Table
-        self.sequence_table = QTableWidget()
-        self.sequence_table.setColumnCount(5)  # Now 5 columns including Length
-        self.sequence_table.setHorizontalHeaderLabels(["Timestamp", "Message ID", "Data (Hex)", "Length (Bytes)", "Type"])
-        
-        # Set column widths
-        self.sequence_table.setColumnWidth(0, 180)  # Timestamp column wider
-        self.sequence_table.setColumnWidth(1, 100)  # Message ID
-        self.sequence_table.setColumnWidth(2, 150)  # Data
-        self.sequence_table.setColumnWidth(3, 150)   # Length
-        self.sequence_table.setColumnWidth(4, 200)  # Type
+        self.model = MessageTableModel(self)
+        self.sequence_table = create_message_view(self.model, type_width=200)
         
         main_layout.addWidget(self.sequence_table)
+        # Older pages are loaded when scrolling to the top
+        self.sequence_table.verticalScrollBar().valueChanged.connect(self.on_scroll)
 
         self.setLayout(main_layout)
 
@@ -53,57 +76,138 @@ class MonitorTab(QWidget):
     def handle_can_message(self, timestamp, message_id, data, msg_type, data_len):
         """Handle signals from CAN tab"""
         can_type = "CAN " + msg_type
+        self.live_until["CAN"] = timestamp
         self.add_data_to_table(message_id, data, can_type, timestamp, data_len)
     
     def handle_someip_message(self, timestamp, message_id, data, msg_type, data_len):
         """Handle signals from SomeIP tab"""
+        self.live_until["SomeIP"] = timestamp
         self.add_data_to_table(message_id, data, msg_type, timestamp, data_len)
 
-    def load_message_sequence(self):
-        """Load the message sequence into the table"""
-        # Clear table
-        self.sequence_table.setRowCount(0)
-        
+    def session_filter(self):
         # Get messages (either all or just current session)
-        messages = self.database.load_message_sequence()
+        return self.database.session_id if self.session_only else None
+
+    def load_message_sequence(self):
+        """Load the newest page of the message sequence, older pages follow on demand"""
+        # Supersedes any pending load, the rows shown stay until the page arrives
+        self.request_page({}, reset=True)
+
+    def load_older_messages(self):
+        """Request the page of messages preceding the oldest row shown"""
+        self.request_page(dict(self.oldest_keys), reset=False)
+
+    def request_page(self, after, reset):
+        self.status_label.setText("Loading...")
+        since = time.time_ns()
+        self.queries.submit(fetch_page, self.database, self.session_filter(), after, key=self.load_key,
+                            callback=lambda page: self.show_page(page, reset, since), error=self.show_error)
+
+    def show_page(self, page, reset, since):
+        """Show a page of the sequence delivered by the query worker"""
+        self.status_label.clear()
+        if reset:
+            self.newest_keys = {}
+            self.oldest_keys = {}
+        self.has_older = len(page) == PAGE_SIZE
+        # Rows are newest first: (timestamp, type, message_id, data, length, table, rowid)
+        for row in page:
+            key = (row[0], row[6])
+            self.oldest_keys[row[5]] = key
+            self.newest_keys.setdefault(row[5], key)
+        if reset and self.has_older:
+            # A table without rows in the first page has nothing newer than the page
+            for table in MESSAGE_TABLES:
+                self.newest_keys.setdefault(table, (page[-1][0], 0))
+        rows = [(row[0], row[2], row[3], row[4], row[1]) for row in reversed(page)]
+        if reset:
+            self.model.replace(rows, since)
+            self.sequence_table.scrollToBottom()
+        else:
+            self.model.prepend_rows(rows)
+            # Keep the rows that were visible in place
+            self.sequence_table.verticalScrollBar().setValue(len(rows))
+
+    def load_newer_messages(self):
+        """Request the database rows newer than the newest row shown"""
+        self.status_label.setText("Loading...")
+        self.queries.submit(fetch_newer, self.database, self.session_filter(), dict(self.newest_keys),
+                            key=self.load_key, callback=self.show_newer, error=self.show_error)
+
+    def show_newer(self, messages):
+        """Append the newer rows delivered by the query worker, a page per model insert"""
+        self.status_label.clear()
+        # Live rows go first so the skip over already shown rows sees them all
+        self.flush_updates()
+        rows = []
+        for timestamp, msg_type, msg_id, data, data_len, table, rowid in messages:
+            key = (timestamp, rowid)
+            self.newest_keys[table] = key
+            self.oldest_keys.setdefault(table, key)
+            if timestamp <= self.live_until.get(table, -1):
+                continue  # Already shown from the tab signals
+            rows.append((timestamp, msg_id, data, data_len, msg_type))
+            if len(rows) == PAGE_SIZE:
+                self.model.append_rows(rows)
+                rows = []
+        self.model.append_rows(rows)
+        self.sequence_table.scrollToBottom()
 
-        for idx, (timestamp, msg_type, msg_id, data, data_len) in enumerate(messages):
-            # Add data to table
-            self.add_data_to_table(msg_id, data, msg_type, timestamp, data_len)
+    def show_error(self, error):
+        self.status_label.setText("Query failed")
+        print(f"Error loading the message sequence: {error}")
+
+    def on_scroll(self, value):
+        """Load the previous page when the table is scrolled to the top"""
+        scrollbar = self.sequence_table.verticalScrollBar()
+        if value == scrollbar.minimum() and self.has_older and not self.queries.is_pending(self.load_key):
+            self.load_older_messages()
 
     def add_data_to_table(self, message_id, data, msg_type, timestamp=None, data_len=None):
-        """Add a row to the table"""
-        row_count = self.sequence_table.rowCount()
-        self.sequence_table.insertRow(row_count)
-        
-        # If data_len is not provided, calculate it
-        if data_len is None and isinstance(data, str):
-            # For hex strings, calculate length in bytes
-            try:
-                data_len = len(bytes.fromhex(data.replace(" ", "")))
-            except ValueError:
-                data_len = len(data)
-        elif data_len is None:
-            data_len = len(data)
-        
-        self.sequence_table.setItem(row_count, 0, QTableWidgetItem(str(timestamp)))
-        self.sequence_table.setItem(row_count, 1, QTableWidgetItem(str(message_id)))
-        self.sequence_table.setItem(row_count, 2, QTableWidgetItem(str(data)))
-        self.sequence_table.setItem(row_count, 3, QTableWidgetItem(str(data_len)))
-        self.sequence_table.setItem(row_count, 4, QTableWidgetItem(str(msg_type)))
-        
-        # Scroll to the new row
-        self.sequence_table.scrollToItem(self.sequence_table.item(row_count, 0))
+        """Add a row to the table on the next UI frame"""
+        self.model.queue(timestamp, message_id, data, message_length(data, data_len), msg_type)
+
+    def flush_updates(self):
+        """Apply the messages received since the last frame with a single scroll"""
+        if self.model.apply_pending():
+            # Scroll to the new rows
+            self.sequence_table.scrollToBottom()
 
 
         
-    def refresh(self):
-        """Refresh the table when needed"""
+    def set_session_only(self, checked):
+        """Switch between the current session and the whole history"""
+        self.session_only = checked
         self.load_message_sequence()
         
+    def refresh(self):
+        """Bring the table up to date with the database without reloading it"""
+        # A pending load already brings the newest rows
+        if not self.queries.is_pending(self.load_key):
+            self.load_newer_messages()
+        
     def delete_database(self):
         """Clear database"""
-        self.database.clear_database()
+        self.status_label.setText("Clearing...")
+        self.queries.submit(self.database.clear_database, key=self.clear_key,
+                            callback=self.database_cleared, error=self.show_error)
+
+    def database_cleared(self, _result):
         self.cantab.clear_table()
         self.someiptab.clear_table()
-        self.refresh()
+        self.model.clear()
+        self.live_until = {}
+        self.load_message_sequence()
+
+def fetch_page(database, session_id, after):
+    """Newest PAGE_SIZE rows of the merged sequence before the `after` keys, run on the query worker
+
+    Compacted runs are shown once, at their first message: expanded, a reverse page would come out
+    of order and its (timestamp, rowid) keys would not match the rows the cursors continue from.
+    """
+    return list(islice(database.iter_message_sequence(reverse=True, session_id=session_id, after=after,
+                                                      expand_repeats=False), PAGE_SIZE))
+
+def fetch_newer(database, session_id, after):
+    """Every row of the merged sequence after the `after` keys, run on the query worker"""
+    return list(database.iter_message_sequence(session_id=session_id, after=after))
@@ -0,0 +1,255 @@
+# profiling.py
+# Opt-in instrumentation for the hot loops: per-phase perf_counter_ns spans,
+# sampling cProfile dumps and a Chrome trace (chrome://tracing, Perfetto) exporter.
+# Nothing is recorded unless PFE_PROFILE is set or enable() is called, and
+# get_tracer() then returns None so the loops only pay for an `if tracer:` test.
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+
+PROFILE_ENV = "PFE_PROFILE"          # "spans", "cprofile" or "spans,cprofile"
+PROFILE_DIR_ENV = "PFE_PROFILE_DIR"  # Output directory for traces and .prof dumps
+PROFILE_MODES = ("spans", "cprofile")
+
+MAX_SPANS = 200000       # Spans kept per tracer, oldest are dropped first
+CPROFILE_PERIOD = 30.0   # Seconds between the start of two cProfile windows
+CPROFILE_WINDOW = 2.0    # Seconds profiled in each window
+
+_modes = set()
+_output_dir = "."
+_tracers = {}
+_sampler = None  # SamplingProfiler shared by every tracer
+_lock = threading.Lock()
+_atexit_registered = False
+
+
+def parse_modes(value):
+    """Parse a comma separated mode list such as 'spans,cprofile'."""
+    if not value:
+        return set()
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    if "all" in modes or "1" in modes:
+        return set(PROFILE_MODES)
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        print(f"Ignoring unknown profiling modes: {', '.join(sorted(unknown))}")
+    return modes & set(PROFILE_MODES)
+
+
+def enable(modes, output_dir=None):
+    """Enable profiling; must run before the instrumented loops call get_tracer()."""
+    global _modes, _output_dir, _atexit_registered
+    if isinstance(modes, str):
+        modes = parse_modes(modes)
+    _modes = set(modes)
+    if output_dir:
+        _output_dir = output_dir
+    if not _modes:
+        return
+    os.makedirs(_output_dir, exist_ok=True)
+    if not _atexit_registered:
+        atexit.register(shutdown)
+        _atexit_registered = True
+    print(f"Profiling enabled ({', '.join(sorted(_modes))}), output in {os.path.abspath(_output_dir)}")
+
+
+def is_enabled():
+    return bool(_modes)
+
+
+def get_tracer(name):
+    """Return the tracer for a hot loop, or None when profiling is disabled."""
+    global _sampler
+    if not _modes:
+        return None
+    with _lock:
+        tracer = _tracers.get(name)
+        if tracer is None:
+            sampler = None
+            if "cprofile" in _modes:
+                if _sampler is None:
+                    _sampler = SamplingProfiler()
+                sampler = _sampler
+            tracer = Tracer(name, "spans" in _modes, sampler)
+            _tracers[name] = tracer
+        return tracer
+
+
+class Tracer:
+    """Records consecutive phases of one loop iteration as spans."""
+    def __init__(self, name, record_spans=True, sampler=None):
+        self.name = name
+        self.spans = deque(maxlen=MAX_SPANS) if record_spans else None
+        self.sampler = sampler
+        self._last = time.perf_counter_ns()
+
+    def begin(self):
+        """Mark the start of a loop iteration."""
+        if self.sampler is not None:
+            self.sampler.tick(self.name)
+        self._last = time.perf_counter_ns()
+
+    def phase(self, name):
+        """Close the phase running since the previous begin()/phase() call."""
+        now = time.perf_counter_ns()
+        if self.spans is not None:
+            self.spans.append((name, threading.get_ident(), self._last, now - self._last))
+        self._last = now
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+
+class SamplingProfiler:
+    """Profiles CPROFILE_WINDOW seconds out of every CPROFILE_PERIOD and dumps .prof files.
+
+    Only one cProfile profiler can be active at a time, so a single sampler is shared by
+    every tracer: a window profiles the thread of the tracer that opened it and is named
+    after that tracer. If cProfile cannot be enabled (another profiler is active), sampling
+    is turned off instead of failing the instrumented loop.
+    """
+    def __init__(self, period=CPROFILE_PERIOD, window=CPROFILE_WINDOW):
+        self.period = period
+        self.window = window
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.owner = None  # Thread ident of the tracer whose window is open
+        self.name = None
+        self.next_start = time.monotonic()  # First window opens on the first tick
+        self.window_end = 0.0
+        self.dumps = {}  # Tracer name -> number of .prof files written
+        self.disabled = False
+
+    def tick(self, name):
+        # cProfile only sees the thread that enabled it, so a window is opened and closed by the same loop
+        now = time.monotonic()
+        with self.lock:
+            if self.disabled:
+                return
+            if self.profiler is None:
+                if now >= self.next_start:
+                    self._start(name, now)
+            elif now >= self.window_end and self.owner == threading.get_ident():
+                self._stop()
+                self.next_start = now + self.period
+
+    def _start(self, name, now):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            print(f"Disabling cProfile sampling: {e}")
+            self.disabled = True
+            return
+        self.profiler = profiler
+        self.owner = threading.get_ident()
+        self.name = name
+        self.window_end = now + self.window
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.profiler is None:
+            return
+        profiler = self.profiler
+        self.profiler = None
+        self.owner = None
+        try:
+            profiler.disable()
+        except ValueError as e:
+            print(f"Disabling cProfile sampling: {e}")
+            self.disabled = True
+            return
+        count = self.dumps.get(self.name, 0)
+        path = os.path.join(_output_dir, f"{self.name}-{os.getpid()}-{count:04d}.prof")
+        try:
+            profiler.dump_stats(path)
+            self.dumps[self.name] = count + 1
+        except OSError as e:
+            print(f"Error writing profile {path}: {e}")
+
+
+def phase_summary():
+    """Return {(tracer, phase): (count, total_ns, max_ns)} over the recorded spans."""
+    summary = {}
+    with _lock:
+        tracers = list(_tracers.values())
+    for tracer in tracers:
+        if tracer.spans is None:
+            continue
+        for name, _tid, _start, duration in list(tracer.spans):
+            count, total, longest = summary.get((tracer.name, name), (0, 0, 0))
+            summary[(tracer.name, name)] = (count + 1, total + duration, max(longest, duration))
+    return summary
+
+
+def print_summary():
+    summary = phase_summary()
+    if not summary:
+        return
+    print("\nPhase timings (count, mean us, max us):")
+    for (tracer_name, name), (count, total, longest) in sorted(summary.items()):
+        print(f"  {tracer_name:16s} {name:12s} {count:8d} {total / count / 1000:10.1f} {longest / 1000:10.1f}")
+
+
+def export_chrome_trace(path=None):
+    """Write every recorded span as a Chrome trace event file and return its path."""
+    if path is None:
+        path = os.path.join(_output_dir, f"trace-{os.getpid()}.json")
+    pid = os.getpid()
+    events = []
+    with _lock:
+        tracers = list(_tracers.values())
+    for tracer in tracers:
+        if tracer.spans is None:
+            continue
+        for name, tid, start, duration in list(tracer.spans):
+            events.append({
+                "name": name,
+                "cat": tracer.name,
+                "ph": "X",  # Complete event: start + duration
+                "ts": start / 1000.0,  # Chrome traces use microseconds
+                "dur": duration / 1000.0,
+                "pid": pid,
+                "tid": tid,
+            })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
+
+
+def shutdown():
+    """Flush cProfile windows, print the phase summary and write the Chrome trace."""
+    with _lock:
+        tracers = list(_tracers.values())
+    for tracer in tracers:
+        tracer.stop()
+    if "spans" in _modes and tracers:
+        print_summary()
+        try:
+            print(f"Chrome trace written to {export_chrome_trace()}")
+        except OSError as e:
+            print(f"Error writing Chrome trace: {e}")
+
+
+def add_arguments(parser):
+    """Add the --profile/--profile-dir options to an argparse parser."""
+    parser.add_argument("--profile", default=None,
+                        help="Enable profiling hooks: spans, cprofile or spans,cprofile")
+    parser.add_argument("--profile-dir", default=None, help="Output directory for profiling data")
+
+
+def configure(args=None):
+    """Enable profiling from parsed --profile arguments, falling back to the environment."""
+    modes = getattr(args, "profile", None) or os.environ.get(PROFILE_ENV)
+    output_dir = getattr(args, "profile_dir", None) or os.environ.get(PROFILE_DIR_ENV)
+    if modes:
+        enable(modes, output_dir)
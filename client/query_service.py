@@ -0,0 +1,82 @@
+# Database queries run on a worker thread, results delivered to the GUI thread as Qt signals
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+
+class QueryRequest:
+    """One submitted query; cancelling it drops its result even if it already runs"""
+    def __init__(self, key, callback, error):
+        self.key = key
+        self.callback = callback
+        self.error = error
+        self.future = None
+        self.cancelled = False
+        self.result = None
+        self.exception = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()  # Only succeeds while the query is still queued
+
+class QueryService(QObject):
+    """Runs database calls in submission order on one worker thread
+
+    Queries on the worker read through the database read pool, so they see a
+    consistent snapshot without blocking the writer or the GUI.
+    """
+    completed = pyqtSignal(object)  # QueryRequest, emitted from the worker thread
+
+    def __init__(self, database, parent=None):
+        super().__init__(parent)
+        self.database = database
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-query")
+        self.latest = {}  # key -> newest QueryRequest
+        # Queued connection: deliver() runs on the thread owning this object, the GUI thread
+        self.completed.connect(self.deliver)
+
+    def submit(self, fn, *args, key=None, callback=None, error=None, **kwargs):
+        """Run fn(*args, **kwargs) on the worker and call callback(result) on the GUI thread
+
+        A request with the same key as a pending one supersedes it, as a newer filter does.
+        fn must return materialized results (lists, not generators).
+        """
+        request = QueryRequest(key, callback, error)
+        if key is not None:
+            previous = self.latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self.latest[key] = request
+        request.future = self.executor.submit(self.run, request, fn, args, kwargs)
+        return request
+
+    def run(self, request, fn, args, kwargs):
+        if request.cancelled:
+            return
+        try:
+            request.result = fn(*args, **kwargs)
+        except Exception as e:
+            request.exception = e
+        self.completed.emit(request)
+
+    def deliver(self, request):
+        if request.key is not None and self.latest.get(request.key) is request:
+            del self.latest[request.key]
+        if request.cancelled:
+            return
+        if request.exception is not None:
+            if request.error is not None:
+                request.error(request.exception)
+            else:
+                print(f"Error running database query: {request.exception}")
+            return
+        if request.callback is not None:
+            request.callback(request.result)
+
+    def is_pending(self, key):
+        return key in self.latest
+
+    def shutdown(self):
+        """Drop pending requests and wait for the running one"""
+        for request in list(self.latest.values()):
+            request.cancel()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,67 @@
+# Read-only connections for queries running beside the GUI thread and the writer
+import queue
+import sqlite3
+import threading
+from urllib.parse import quote
+from contextlib import contextmanager
+
+READ_POOL_SIZE = 4   # Connections kept open for worker threads
+READ_TIMEOUT = 10.0  # Seconds a reader waits on a lock (only checkpoints and schema changes take one)
+
+def open_reader(path, timeout=READ_TIMEOUT):
+    """Open a read-only connection to the message database, for scripts running beside the client
+
+    In WAL mode readers never block the writer and see the last commit made before their query started.
+    """
+    conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, timeout=timeout)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+class ReadPool:
+    """Bounded pool of query_only connections shared by worker threads"""
+    def __init__(self, connect, size=READ_POOL_SIZE):
+        self.connect = connect  # Returns a connection usable from any thread
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take an idle connection, opening one while below size, else wait for one"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            create = self.opened < self.size
+            if create:
+                self.opened += 1
+        if not create:
+            return self.idle.get()
+        conn = self.connect()
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    @contextmanager
+    def snapshot(self):
+        """Borrow a connection whose queries all read the same committed state"""
+        conn = self.acquire()
+        try:
+            # The read transaction pins the WAL snapshot taken by its first query until release
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close the idle connections, connections still borrowed are closed on release by their owner"""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,122 @@
+# Retention of recorded messages by age, row count and file size
+import sqlite3
+import threading
+import time
+from rollups import prune_rollups
+
+RETENTION_INTERVAL = 60.0  # Seconds between two enforcement passes
+DELETE_CHUNK = 5000        # Rows deleted per transaction, keeps the writer from waiting on long locks
+VACUUM_PAGES = 1000        # Free pages handed back to the file system per incremental_vacuum step
+
+class RetentionPolicy:
+    """Limits applied to every message table, None disables a limit"""
+    def __init__(self, max_age=None, max_rows=None, max_bytes=None,
+                 interval=RETENTION_INTERVAL, chunk_size=DELETE_CHUNK):
+        self.max_age = max_age      # Seconds
+        self.max_rows = max_rows    # Rows per table
+        self.max_bytes = max_bytes  # Bytes used by the database file
+        self.interval = interval
+        self.chunk_size = chunk_size
+
+    def is_enabled(self):
+        return any(limit is not None for limit in (self.max_age, self.max_rows, self.max_bytes))
+
+def used_bytes(conn):
+    """Bytes of the database file holding data, free pages excluded"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - free_pages) * page_size
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    """Return free pages to the file system in bounded steps"""
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free_pages > 0:
+        # The pragma only does its work while its rows are stepped through
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            break  # auto_vacuum is not INCREMENTAL, nothing can be reclaimed
+        free_pages = remaining
+
+class RetentionTask(threading.Thread):
+    """Background thread enforcing a RetentionPolicy on the message tables"""
+    def __init__(self, database, policy, tables):
+        super().__init__(name="db-retention", daemon=True)
+        self.database = database
+        self.policy = policy
+        self.tables = tables
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = self.database.connect()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    deleted = self.enforce(conn)
+                    if deleted:
+                        print(f"Retention: deleted {deleted} old messages")
+                except sqlite3.Error as e:
+                    print(f"Error enforcing message retention: {e}")
+                self.stopped.wait(self.policy.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def enforce(self, conn):
+        """Apply every configured limit once and return the number of deleted rows"""
+        deleted = 0
+        if self.policy.max_age is not None:
+            cutoff = time.time_ns() - int(self.policy.max_age * 1_000_000_000)
+            for table in self.tables:
+                deleted += self.delete_oldest(conn, table, "WHERE timestamp < ?", (cutoff,))
+            prune_rollups(conn, cutoff)
+
+        if self.policy.max_rows is not None:
+            for table in self.tables:
+                count = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                if count > self.policy.max_rows:
+                    deleted += self.delete_oldest(conn, table, limit=count - self.policy.max_rows)
+
+        if deleted:
+            incremental_vacuum(conn)
+
+        if self.policy.max_bytes is not None:
+            # Drop the globally oldest chunk until the data fits, vacuuming as we go
+            while used_bytes(conn) > self.policy.max_bytes and not self.stopped.is_set():
+                table = self.oldest_table(conn)
+                if table is None:
+                    break
+                removed = self.delete_oldest(conn, table, limit=self.policy.chunk_size)
+                if not removed:
+                    break
+                deleted += removed
+                incremental_vacuum(conn)
+        return deleted
+
+    def oldest_table(self, conn):
+        """Return the table holding the oldest message, or None if all are empty"""
+        oldest = None
+        for table in self.tables:
+            row = conn.execute(f"SELECT min(timestamp) FROM {table}").fetchone()
+            if row[0] is not None and (oldest is None or row[0] < oldest[0]):
+                oldest = (row[0], table)
+        return oldest[1] if oldest else None
+
+    def delete_oldest(self, conn, table, where="", params=(), limit=None):
+        """Delete the oldest matching rows in chunks, committing after each chunk"""
+        deleted = 0
+        while limit is None or deleted < limit:
+            chunk = self.policy.chunk_size if limit is None else min(self.policy.chunk_size, limit - deleted)
+            with conn:
+                cursor = conn.execute(f"""DELETE FROM {table} WHERE rowid IN
+                                          (SELECT rowid FROM {table} {where} ORDER BY timestamp, rowid LIMIT ?)""",
+                                      (*params, chunk))
+            deleted += cursor.rowcount
+            if cursor.rowcount < chunk or self.stopped.is_set():
+                break
+        return deleted
@@ -0,0 +1,41 @@
+# Fixed-capacity sample buffers for the live graph
+import numpy as np
+
+GRAPH_CAPACITY = 1 << 18  # Points kept per series (over 7 hours at 10 Hz), older points are overwritten
+
+class RingBuffer:
+    """Preallocated (x, y) ring of float64 samples with O(1) appends
+
+    Every sample is written twice, at i and i + capacity, so the newest `size`
+    samples always form one contiguous slice and reading them copies nothing.
+    """
+    def __init__(self, capacity=GRAPH_CAPACITY):
+        self.capacity = capacity
+        self.x = np.zeros(2 * capacity)
+        self.y = np.zeros(2 * capacity)
+        self.head = 0  # Next write position in [0, capacity)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, x, y):
+        i = self.head
+        self.x[i] = self.x[i + self.capacity] = x
+        self.y[i] = self.y[i + self.capacity] = y
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def start(self):
+        """Index of the oldest sample in the doubled arrays"""
+        return self.head - self.size + (self.capacity if self.head < self.size else 0)
+
+    def data(self):
+        """Return (x, y) views of the samples, oldest first"""
+        start = self.start()
+        return self.x[start:start + self.size], self.y[start:start + self.size]
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
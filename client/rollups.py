@@ -0,0 +1,139 @@
+# Per time bucket rollups of decoded message values (temperature, fan level)
+# maintained incrementally by the database writer
+NS_PER_SECOND = 1_000_000_000
+RESOLUTIONS = (1, 60)  # Bucket sizes in seconds, one rollup table each
+BACKFILL_CHUNK = 10000  # Raw rows aggregated per upsert when building rollups for existing data
+
+def rollup_table(resolution):
+    return f"rollup_{resolution}s"
+
+def payload_value(payload):
+    """Decode a payload of 1 to 8 bytes as a big-endian unsigned value, None otherwise"""
+    if payload is None or not 0 < len(payload) <= 8:
+        return None
+    return int.from_bytes(payload, "big")
+
+def create_rollup_tables(conn):
+    for resolution in RESOLUTIONS:
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {rollup_table(resolution)}
+                        (source TEXT NOT NULL, message_id TEXT NOT NULL, type TEXT NOT NULL, bucket INTEGER NOT NULL,
+                         count INTEGER NOT NULL, min_value INTEGER, max_value INTEGER, sum_value INTEGER,
+                         last_value INTEGER, last_timestamp INTEGER,
+                         PRIMARY KEY (source, message_id, type, bucket)) WITHOUT ROWID''')
+
+def aggregate(rows_by_table, resolution):
+    """Fold raw rows into {(source, message_id, type, bucket): [count, min, max, sum, last, last_timestamp]}"""
+    width = resolution * NS_PER_SECOND
+    buckets = {}
+    for source, rows in rows_by_table.items():
+        for row in rows:
+            timestamp, message_id, msg_type, payload = row
+            value = payload_value(payload)
+            if value is None:
+                continue
+            key = (source, message_id, msg_type, timestamp - timestamp % width)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, value, value, value, value, timestamp]
+                continue
+            bucket[0] += 1
+            if value < bucket[1]:
+                bucket[1] = value
+            if value > bucket[2]:
+                bucket[2] = value
+            bucket[3] += value
+            if timestamp >= bucket[5]:
+                bucket[4] = value
+                bucket[5] = timestamp
+    return buckets
+
+def write_rollups(conn, rows_by_table):
+    """Merge (timestamp, message_id, type, payload) rows into every rollup table
+
+    Runs inside the caller's transaction so rollups commit together with the raw rows.
+    """
+    for resolution in RESOLUTIONS:
+        buckets = aggregate(rows_by_table, resolution)
+        if not buckets:
+            continue
+        conn.executemany(f'''INSERT INTO {rollup_table(resolution)}
+                            (source, message_id, type, bucket, count, min_value, max_value, sum_value,
+                             last_value, last_timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (source, message_id, type, bucket) DO UPDATE SET
+                                count = count + excluded.count,
+                                min_value = min(min_value, excluded.min_value),
+                                max_value = max(max_value, excluded.max_value),
+                                sum_value = sum_value + excluded.sum_value,
+                                last_value = CASE WHEN excluded.last_timestamp >= last_timestamp
+                                                  THEN excluded.last_value ELSE last_value END,
+                                last_timestamp = max(last_timestamp, excluded.last_timestamp)''',
+                         [key + tuple(bucket) for key, bucket in buckets.items()])
+
+def expand_runs(rows):
+    """Expand (timestamp, message_id, type, payload, repeat_count, last_timestamp) rows of compacted runs"""
+    for timestamp, message_id, msg_type, payload, count, last in rows:
+        if count <= 1:
+            yield (timestamp, message_id, msg_type, payload)
+            continue
+        for i in range(count):
+            yield (timestamp + (last - timestamp) * i // (count - 1), message_id, msg_type, payload)
+
+def backfill_rollups(conn, tables):
+    """Build the rollups for rows written before they existed, a chunk at a time"""
+    for table in tables:
+        cursor = conn.execute(f"SELECT timestamp, message_id, type, data FROM {table} ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(BACKFILL_CHUNK)
+            if not rows:
+                break
+            write_rollups(conn, {table: rows})
+
+def rebuild_rollups(conn, tables, start, end):
+    """Recompute every rollup bucket overlapping [start, end] from the remaining raw rows"""
+    # Align to the widest bucket so every affected bucket is rebuilt from all of its rows
+    width = max(RESOLUTIONS) * NS_PER_SECOND
+    low = start - start % width
+    high = end - end % width + width
+    for resolution in RESOLUTIONS:
+        conn.execute(f"DELETE FROM {rollup_table(resolution)} WHERE bucket >= ? AND bucket < ?", (low, high))
+    for table in tables:
+        cursor = conn.execute(f"""SELECT timestamp, message_id, type, data, repeat_count,
+                                         coalesce(last_timestamp, timestamp) FROM {table}
+                                  WHERE timestamp >= ? AND timestamp < ?""", (low, high))
+        while True:
+            rows = cursor.fetchmany(BACKFILL_CHUNK)
+            if not rows:
+                break
+            write_rollups(conn, {table: list(expand_runs(rows))})
+
+def pick_resolution(resolution):
+    """Return the coarsest rollup resolution not exceeding the requested one, or None for raw rows"""
+    candidates = [r for r in RESOLUTIONS if r <= resolution]
+    return max(candidates) if candidates else None
+
+def load_rollup(conn, resolution, source, message_id, msg_type, start=None, end=None):
+    """Return (bucket, count, min, max, avg, last) rows of one rollup table in time order"""
+    query = f'''SELECT bucket, count, min_value, max_value, CAST(sum_value AS REAL) / count, last_value
+                FROM {rollup_table(resolution)} WHERE source = ? AND message_id = ? AND type = ?'''
+    params = [source, message_id, msg_type]
+    if start is not None:
+        query += " AND bucket >= ?"
+        params.append(start - start % (resolution * NS_PER_SECOND))
+    if end is not None:
+        query += " AND bucket < ?"
+        params.append(end)
+    query += " ORDER BY bucket"
+    return conn.execute(query, params).fetchall()
+
+def prune_rollups(conn, cutoff):
+    """Delete rollup buckets older than cutoff (nanoseconds)"""
+    deleted = 0
+    for resolution in RESOLUTIONS:
+        with conn:
+            deleted += conn.execute(f"DELETE FROM {rollup_table(resolution)} WHERE bucket < ?", (cutoff,)).rowcount
+    return deleted
+
+def clear_rollups(conn):
+    for resolution in RESOLUTIONS:
+        conn.execute(f"DELETE FROM {rollup_table(resolution)}")
@@ -0,0 +1,124 @@
+# CAN <-> SOME/IP routing table, loaded from JSON and compiled into dict lookups at startup
+import json
+import struct
+
+# SOME/IP header fields common to every message forwarded from CAN
+CLIENT_ID = 0x0001
+SESSION_ID = 0x0001
+PROTOCOL_VERSION = 0x01
+INTERFACE_VERSION = 0x01
+MESSAGE_TYPE = 0x00  # Request
+HEADER_PREFIX = struct.Struct("!HHHHBBBx")  # SOME/IP header up to the payload length
+PAYLOAD_LENGTH = struct.Struct("!I")
+STANDARD_MASK = 0x7FF      # 11-bit CAN IDs
+EXTENDED_MASK = 0x1FFFFFFF  # 29-bit CAN IDs
+
+# Payload conversions a route can apply, by config name
+TRANSFORMS = {
+    "raw": bytes,                                   # Payload unchanged
+    "hex": lambda data: data.hex().encode(),        # Bytes to ASCII hex digits, what the server expects
+    "unhex": lambda data: bytes.fromhex(str(data, "ascii")),  # ASCII hex digits back to bytes
+}
+
+# Routes used without a config file, the forwarding rules the gateway always had
+DEFAULT_ROUTES = {
+    "can_to_someip": [
+        {"can_id": "0x123", "service_id": "0x1", "method_id": "0x1", "transform": "hex"},
+    ],
+    "someip_to_can": [
+        # No service_id/method_id: the route of every message without a route of its own
+        {"can_id": "0x3", "transform": "raw"},
+    ],
+}
+
+class CanRoute:
+    """CAN ID -> SOME/IP service and method, with the header packed once"""
+    def __init__(self, can_id, service_id, method_id, transform):
+        self.can_id = can_id
+        self.can_id_hex = hex(can_id)
+        self.someip_id = f"{hex(service_id)}{method_id}"  # Message ID shown and recorded
+        self.header = HEADER_PREFIX.pack(service_id, method_id, CLIENT_ID, SESSION_ID,
+                                         PROTOCOL_VERSION, INTERFACE_VERSION, MESSAGE_TYPE)
+        self.transform = transform
+
+    def encode(self, data):
+        """Return the SOME/IP message carrying the transformed CAN data"""
+        payload = self.transform(data)
+        return self.header + PAYLOAD_LENGTH.pack(len(payload)) + payload
+
+class SomeIPRoute:
+    """SOME/IP service and method -> CAN ID"""
+    def __init__(self, can_id, transform):
+        self.can_id = can_id
+        self.can_id_hex = hex(can_id)
+        self.transform = transform
+
+class RoutingTable:
+    """Compiled routes: one dict lookup per frame whatever the number of routes
+
+    Frames without a route are dropped and counted in unrouted_can / unrouted_someip.
+    """
+    def __init__(self, config):
+        self.can = {}           # CAN ID -> CanRoute
+        self.someip = {}        # (service_id, method_id) -> SomeIPRoute
+        self.someip_default = None
+        self.unrouted_can = 0
+        self.unrouted_someip = 0
+        for entry in config.get("can_to_someip", []):
+            can_id = parse_id(entry, "can_id")
+            if can_id in self.can:
+                raise ValueError(f"Duplicate route for CAN ID {hex(can_id)}")
+            self.can[can_id] = CanRoute(can_id, parse_id(entry, "service_id"), parse_id(entry, "method_id"),
+                                        parse_transform(entry, "hex"))
+        for entry in config.get("someip_to_can", []):
+            route = SomeIPRoute(parse_id(entry, "can_id"), parse_transform(entry, "raw"))
+            if "service_id" not in entry and "method_id" not in entry:
+                if self.someip_default is not None:
+                    raise ValueError("More than one default SOME/IP route")
+                self.someip_default = route
+                continue
+            key = (parse_id(entry, "service_id"), parse_id(entry, "method_id"))
+            if key in self.someip:
+                raise ValueError(f"Duplicate route for SOME/IP {hex(key[0])}/{hex(key[1])}")
+            self.someip[key] = route
+
+    def can_filters(self):
+        """python-can acceptance filters matching exactly the routed CAN IDs
+
+        SocketCAN installs them in the kernel, so other frames never reach the process.
+        Without CAN routes the list is empty, which python-can treats as accept all.
+        """
+        return [{"can_id": can_id, "can_mask": EXTENDED_MASK if can_id > STANDARD_MASK else STANDARD_MASK,
+                 "extended": can_id > STANDARD_MASK} for can_id in sorted(self.can)]
+
+    def route_someip(self, service_id, method_id):
+        """Return the SomeIPRoute of a message, None (counted) when it has none"""
+        route = self.someip.get((service_id, method_id), self.someip_default)
+        if route is None:
+            self.unrouted_someip += 1
+        return route
+
+def parse_id(entry, name):
+    """Read an ID given as a number or a string such as "0x123" """
+    try:
+        value = entry[name]
+        return int(value, 0) if isinstance(value, str) else int(value)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Route {entry} needs a numeric {name}")
+
+def parse_transform(entry, default):
+    name = entry.get("transform", default)
+    if name not in TRANSFORMS:
+        raise ValueError(f"Unknown transform {name!r}, expected one of {', '.join(TRANSFORMS)}")
+    return TRANSFORMS[name]
+
+def load_routes(path=None):
+    """Compile the routes of a JSON file, or DEFAULT_ROUTES without one"""
+    if path is None:
+        return RoutingTable(DEFAULT_ROUTES)
+    with open(path) as f:
+        return RoutingTable(json.load(f))
+
+def add_arguments(parser):
+    parser.add_argument("--routes", default=None,
+                        help="JSON routing table (can_to_someip / someip_to_can), built-in routes without it")
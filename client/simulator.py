@@ -18,7 +18,9 @@ class CANBusInterface:
     def __init__(self, channel="vcan0", bustype="socketcan"):
         self.channel = channel
         self.bustype = bustype
-        self.bus = can.interface.Bus(channel=self.channel, bustype=self.bustype)
+        # Only fan speed frames are received, SocketCAN filters the rest of the bus in the kernel
+        self.bus = can.interface.Bus(channel=self.channel, bustype=self.bustype,
+                                     can_filters=[{"can_id": FAN_MSG_ID, "can_mask": 0x7FF, "extended": False}])
         self.running = True
         self.last_fan_level = 0  # Changed to fan level (0-3)
         self.last_temp = 0
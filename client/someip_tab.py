@@ -1,18 +1,34 @@
 # SomeIP Tab Update
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QComboBox, QHBoxLayout, QTableWidget, 
-    QTableWidgetItem, QPushButton, QLineEdit
+    QWidget, QVBoxLayout, QLabel, QComboBox, QHBoxLayout, QPushButton, QLineEdit
 )
 from someip_module import SomeIPClient
 from PyQt6.QtCore import pyqtSignal
+from message_model import MessageTableModel, create_message_view, message_length
+from query_service import QueryService
+from database import PAGE_SIZE
+import time
 
 class SomeIPTab(QWidget):
         
-    message_received = pyqtSignal(str, str, str, str, int)  # timestamp, message_id, data, type, length
-    def __init__(self, database):
+    message_received = pyqtSignal(object, str, object, str, int)  # timestamp (ns), message_id, data (bytes or hex), type, length
+    def __init__(self, database, queries=None):
         super().__init__()
         self.database = database
+        # Page loads run on the query worker, the GUI keeps the current rows until they arrive
+        self.queries = queries or QueryService(database, self)
+        self.page_key = "someip_page"
         self.someip_client = SomeIPClient()
+        
+        # Active filters and the (timestamp, rowid) key of the oldest row shown
+        self.id_filter = None
+        self.type_filter = None
+        self.oldest_key = None
+        self.has_older = False
+        # Key of the newest row of the last unfiltered page from the top, None while it loads or
+        # when the table is empty; an attached viewer follows the recorder from there
+        self.newest_key = None
+        self.history_loaded = False
         self.init_ui()
         
     def init_ui(self):
@@ -20,7 +36,7 @@ class SomeIPTab(QWidget):
         # Filter controls
         filter_layout = QHBoxLayout()
         self.filter_id_input = QLineEdit()
-        self.filter_id_input.setPlaceholderText("Filter by Message ID...")
+        self.filter_id_input.setPlaceholderText("Filter by Message ID: 0x123, 0x100-0x1ff, 0x12*, ~text")
     
         self.filter_type_combo = QComboBox()
         self.filter_type_combo.addItem("All Types")
@@ -36,21 +52,17 @@ class SomeIPTab(QWidget):
         filter_layout.addWidget(self.filter_type_combo)
         filter_layout.addWidget(self.filter_button)
         filter_layout.addWidget(self.reset_filter_button)
+        self.status_label = QLabel("")
+        filter_layout.addWidget(self.status_label)
     
         layout.addLayout(filter_layout)
         # Table for displaying SomeIP messages
-        self.someip_table = QTableWidget()
-        self.someip_table.setColumnCount(5)  # Now 5 columns including Length
-        self.someip_table.setHorizontalHeaderLabels(["Timestamp", "Message ID", "Data (Hex)", "Length (Bytes)", "Type"])
-        
-        # Set column widths to accommodate full timestamp
-        self.someip_table.setColumnWidth(0, 180)  # Timestamp column wider
-        self.someip_table.setColumnWidth(1, 100)  # Message ID
-        self.someip_table.setColumnWidth(2, 150)  # Data
-        self.someip_table.setColumnWidth(3, 150)   # Length
-        self.someip_table.setColumnWidth(4, 100)  # Type
+        self.model = MessageTableModel(self)
+        self.someip_table = create_message_view(self.model)
         
         layout.addWidget(self.someip_table)
+        # Older pages are loaded when scrolling to the top
+        self.someip_table.verticalScrollBar().valueChanged.connect(self.on_scroll)
         
         # Input fields and send button
         self.someip_id_input = QLineEdit("X055")
@@ -81,7 +93,8 @@ class SomeIPTab(QWidget):
         # Actually send the message
         if self.someip_client.send_message(message_id, data):
             timestamp = self.database.save_message("SomeIP", message_id, data, "Tx", data_len)
-            self.add_data_to_table(message_id, data, "Tx", timestamp, data_len)
+            # Through the signal, the monitor skips database rows older than the last one shown live
+            self.show_message(timestamp, message_id, data, "Tx", data_len)
         
     def send_someip_message(self, message_id, data):
         """Handle SOMEIP messages generated from CAN messages"""
@@ -92,10 +105,7 @@ class SomeIPTab(QWidget):
             data_len = len(data)
             
         timestamp = self.database.save_message("SomeIP", message_id, data, "Tx", data_len)
-        self.add_data_to_table(message_id, data, "Tx", timestamp, data_len)
-        
-        # Emit signal with message details
-        self.message_received.emit(timestamp, message_id, data, "SomeIP Tx", data_len)
+        self.show_message(timestamp, message_id, data, "Tx", data_len)
     
     def receive_someip_message(self, message_id, data):
         """Handle received SomeIP messages"""
@@ -106,63 +116,91 @@ class SomeIPTab(QWidget):
             data_len = len(data)
             
         timestamp = self.database.save_message("SomeIP", message_id, data, "Rx", data_len)
-        self.add_data_to_table(message_id, data, "Rx", timestamp, data_len)
+        self.show_message(timestamp, message_id, data, "Rx", data_len)
+
+    def show_message(self, timestamp, message_id, data, msg_type, data_len):
+        """Show a message already in the database, recorded here or by the gateway daemon"""
+        self.add_data_to_table(message_id, data, msg_type, timestamp, data_len)
         
         # Emit signal with message details
-        self.message_received.emit(timestamp, message_id, data, "SomeIP Rx", data_len)
+        self.message_received.emit(timestamp, message_id, data, f"SomeIP {msg_type}", data_len)
     
     def add_data_to_table(self, message_id, data, msg_type, timestamp=None, data_len=None):
-        row_count = self.someip_table.rowCount()
-        self.someip_table.insertRow(row_count)
-        
-        # If data_len is not provided, calculate it
-        if data_len is None and isinstance(data, str):
-            # For hex strings, each byte is represented by 2 hex characters
-            data_len = len(bytes.fromhex(data.replace(" ", "")))
-        elif data_len is None:
-            data_len = len(data)
-        
-        self.someip_table.setItem(row_count, 0, QTableWidgetItem(timestamp))
-        self.someip_table.setItem(row_count, 1, QTableWidgetItem(message_id))
-        self.someip_table.setItem(row_count, 2, QTableWidgetItem(data))
-        self.someip_table.setItem(row_count, 3, QTableWidgetItem(str(data_len)))
-        self.someip_table.setItem(row_count, 4, QTableWidgetItem(msg_type))
+        # Shown on the next UI frame by flush_updates()
+        self.model.queue(timestamp, message_id, data, message_length(data, data_len), msg_type)
+
+    def flush_updates(self):
+        """Apply the messages received since the last frame"""
+        self.model.apply_pending()
         
     def load_saved_messages(self):
-        """Load saved messages from the database"""
-        messages = self.database.load_messages("SomeIP")
-        for msg in messages:
-            # messages format: timestamp, message_id, data, type, length
-            if len(msg) >= 5:  # If database already has length field
-                self.add_data_to_table(msg[1], msg[2], msg[3], msg[0], msg[4])
-            else:  # For backward compatibility
-                self.add_data_to_table(msg[1], msg[2], msg[3], msg[0])
-    
+        """Load the newest page of saved messages, older pages follow on demand"""
+        # Supersedes a pending load, such as the page of a previous filter
+        self.request_page(None, reset=True)
+
+    def load_older_messages(self):
+        """Request the page of messages preceding the oldest row shown"""
+        self.request_page(self.oldest_key, reset=False)
+
+    def request_page(self, after, reset):
+        self.status_label.setText("Loading...")
+        since = time.time_ns()
+        self.queries.submit(self.database.load_page, "SomeIP", PAGE_SIZE, after=after, reverse=True,
+                            message_id=self.id_filter, msg_type=self.type_filter, key=self.page_key,
+                            callback=lambda page: self.show_page(page, reset, since),
+                            error=self.show_error)
+
+    def show_page(self, page, reset, since):
+        """Show a page delivered by the query worker"""
+        self.status_label.clear()
+        self.has_older = len(page) == PAGE_SIZE
+        # messages format: timestamp, message_id, data, type, length, rowid, ...
+        if page:
+            self.oldest_key = (page[-1][0], page[-1][5])
+        
+        # The page is newest first, the model takes it in chronological order
+        rows = [(msg[0], msg[1], msg[2], msg[4], msg[3]) for msg in reversed(page)]
+        if reset:
+            if not page:
+                self.oldest_key = None
+            if self.id_filter is None and self.type_filter is None:
+                self.newest_key = (page[0][0], page[0][5]) if page else None
+                self.history_loaded = True
+            self.model.replace(rows, since)
+            self.someip_table.scrollToBottom()
+        else:
+            self.model.prepend_rows(rows)
+            # Keep the rows that were visible in place
+            self.someip_table.verticalScrollBar().setValue(len(rows))
+
+    def show_error(self, error):
+        self.status_label.setText("Query failed")
+        print(f"Error loading SomeIP messages: {error}")
+
+    def on_scroll(self, value):
+        """Load the previous page when the table is scrolled to the top"""
+        scrollbar = self.someip_table.verticalScrollBar()
+        if value == scrollbar.minimum() and self.has_older and not self.queries.is_pending(self.page_key):
+            self.load_older_messages()
+
     def apply_filter(self):
         """Apply filters to the SOMEIP message table"""
-        # Clear current table
-        self.someip_table.setRowCount(0)
-    
         # Get filter values
-        id_filter = self.filter_id_input.text()
-        type_filter = self.filter_type_combo.currentText()
-        if type_filter == "All Types":
-            type_filter = None
+        self.id_filter = self.filter_id_input.text() or None
+        self.type_filter = self.filter_type_combo.currentText()
+        if self.type_filter == "All Types":
+            self.type_filter = None
     
-        # Load filtered messages
-        messages = self.database.load_messages_filtered("SomeIP", id_filter, type_filter)
-        for msg in messages:
-            # messages format: timestamp, message_id, data, type, length
-            if len(msg) >= 5:  # If database already has length field
-                self.add_data_to_table(msg[1], msg[2], msg[3], msg[0], msg[4])
-            else:  # For backward compatibility
-                self.add_data_to_table(msg[1], msg[2], msg[3], msg[0])
+        # Load the newest page of filtered messages
+        self.load_saved_messages()
 
     def reset_filter(self):
         """Reset filters and reload all messages"""
         self.filter_id_input.clear()
         self.filter_type_combo.setCurrentIndex(0)
+        self.id_filter = None
+        self.type_filter = None
         self.load_saved_messages()
     
     def clear_table(self):
-        self.someip_table.setRowCount(0)
+        self.model.clear()
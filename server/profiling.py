@@ -0,0 +1,188 @@
+# profiling.py
+# Opt-in instrumentation of the server loop: per-phase perf_counter_ns spans,
+# sampling cProfile dumps and a Chrome trace (chrome://tracing, Perfetto) exporter.
+# Nothing is recorded unless PFE_PROFILE or --profile is set, and get_tracer()
+# then returns None so the loop only pays for an `if tracer:` test.
+# The server runs a single loop on one thread; client/profiling.py handles several.
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+
+PROFILE_ENV = "PFE_PROFILE"          # "spans", "cprofile" or "spans,cprofile"
+PROFILE_DIR_ENV = "PFE_PROFILE_DIR"  # Output directory for traces and .prof dumps
+PROFILE_MODES = ("spans", "cprofile")
+
+MAX_SPANS = 200000       # Spans kept, oldest are dropped first
+CPROFILE_PERIOD = 30.0   # Seconds between the start of two cProfile windows
+CPROFILE_WINDOW = 2.0    # Seconds profiled in each window
+
+_modes = set()
+_output_dir = "."
+_tracer = None
+
+
+def parse_modes(value):
+    """Parse a comma separated mode list such as 'spans,cprofile'."""
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    if "all" in modes or "1" in modes:
+        return set(PROFILE_MODES)
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        print(f"Ignoring unknown profiling modes: {', '.join(sorted(unknown))}")
+    return modes & set(PROFILE_MODES)
+
+
+def get_tracer(name):
+    """Return the tracer of the server loop, or None when profiling is disabled."""
+    global _tracer
+    if not _modes:
+        return None
+    if _tracer is None:
+        _tracer = Tracer(name, "spans" in _modes, "cprofile" in _modes)
+    return _tracer
+
+
+class Tracer:
+    """Records consecutive phases of one loop iteration as spans."""
+    def __init__(self, name, record_spans=True, sample_cprofile=False):
+        self.name = name
+        self.spans = deque(maxlen=MAX_SPANS) if record_spans else None
+        self.sampler = SamplingProfiler(name) if sample_cprofile else None
+        self._last = time.perf_counter_ns()
+
+    def begin(self):
+        """Mark the start of a loop iteration."""
+        if self.sampler is not None:
+            self.sampler.tick()
+        self._last = time.perf_counter_ns()
+
+    def phase(self, name):
+        """Close the phase running since the previous begin()/phase() call."""
+        now = time.perf_counter_ns()
+        if self.spans is not None:
+            self.spans.append((name, threading.get_ident(), self._last, now - self._last))
+        self._last = now
+
+
+class SamplingProfiler:
+    """Profiles CPROFILE_WINDOW seconds out of every CPROFILE_PERIOD and dumps .prof files.
+
+    Sampling is turned off, instead of failing the server loop, when cProfile cannot be
+    enabled because another profiler is active.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.profiler = None
+        self.next_start = time.monotonic()  # First window opens on the first tick
+        self.window_end = 0.0
+        self.dumps = 0
+        self.disabled = False
+
+    def tick(self):
+        if self.disabled:
+            return
+        now = time.monotonic()
+        if self.profiler is None:
+            if now >= self.next_start:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError as e:
+                    print(f"Disabling cProfile sampling: {e}")
+                    self.disabled = True
+                    return
+                self.profiler = profiler
+                self.window_end = now + CPROFILE_WINDOW
+        elif now >= self.window_end:
+            self.stop()
+            self.next_start = now + CPROFILE_PERIOD
+
+    def stop(self):
+        if self.profiler is None:
+            return
+        profiler = self.profiler
+        self.profiler = None
+        try:
+            profiler.disable()
+        except ValueError as e:
+            print(f"Disabling cProfile sampling: {e}")
+            self.disabled = True
+            return
+        path = os.path.join(_output_dir, f"{self.name}-{os.getpid()}-{self.dumps:04d}.prof")
+        try:
+            profiler.dump_stats(path)
+            self.dumps += 1
+        except OSError as e:
+            print(f"Error writing profile {path}: {e}")
+
+
+def print_summary(tracer):
+    """Print count, mean and max duration of every phase."""
+    summary = {}
+    for name, _tid, _start, duration in tracer.spans:
+        count, total, longest = summary.get(name, (0, 0, 0))
+        summary[name] = (count + 1, total + duration, max(longest, duration))
+    if not summary:
+        return
+    print("\nPhase timings (count, mean us, max us):")
+    for name, (count, total, longest) in sorted(summary.items()):
+        print(f"  {tracer.name:16s} {name:12s} {count:8d} {total / count / 1000:10.1f} {longest / 1000:10.1f}")
+
+
+def export_chrome_trace(tracer):
+    """Write the recorded spans as a Chrome trace event file and return its path."""
+    path = os.path.join(_output_dir, f"trace-{os.getpid()}.json")
+    pid = os.getpid()
+    events = [{
+        "name": name,
+        "cat": tracer.name,
+        "ph": "X",  # Complete event: start + duration
+        "ts": start / 1000.0,  # Chrome traces use microseconds
+        "dur": duration / 1000.0,
+        "pid": pid,
+        "tid": tid,
+    } for name, tid, start, duration in tracer.spans]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
+
+
+def shutdown():
+    """Flush the cProfile window, print the phase summary and write the Chrome trace."""
+    if _tracer is None:
+        return
+    if _tracer.sampler is not None:
+        _tracer.sampler.stop()
+    if _tracer.spans is not None:
+        print_summary(_tracer)
+        try:
+            print(f"Chrome trace written to {export_chrome_trace(_tracer)}")
+        except OSError as e:
+            print(f"Error writing Chrome trace: {e}")
+
+
+def add_arguments(parser):
+    """Add the --profile/--profile-dir options to an argparse parser."""
+    parser.add_argument("--profile", default=None,
+                        help="Enable profiling hooks: spans, cprofile or spans,cprofile")
+    parser.add_argument("--profile-dir", default=None, help="Output directory for profiling data")
+
+
+def configure(args=None):
+    """Enable profiling from parsed --profile arguments, falling back to the environment."""
+    global _modes, _output_dir
+    modes = getattr(args, "profile", None) or os.environ.get(PROFILE_ENV)
+    if not modes:
+        return
+    _modes = parse_modes(modes)
+    if not _modes:
+        return
+    _output_dir = getattr(args, "profile_dir", None) or os.environ.get(PROFILE_DIR_ENV) or "."
+    os.makedirs(_output_dir, exist_ok=True)
+    atexit.register(shutdown)
+    print(f"Profiling enabled ({', '.join(sorted(_modes))}), output in {os.path.abspath(_output_dir)}")
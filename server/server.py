@@ -7,6 +7,7 @@ from constants import TEMPERATURE_SERVICE_ID, CHECK_TEMPERATURE_METHOD_ID, SET_F
 from someip_protocol import parse_someip_header, create_someip_response
 from temperature_service import handle_check_temperature, handle_set_fan_speed
 from logger import log_received_message, log_sent_response
+import profiling
 
 def run_server():
     """Run the SOME/IP server."""
@@ -26,10 +27,16 @@ def run_server():
     print(f"      Receives: Fan speed level (0-4)")
     print(f"      Returns: Confirmation of set fan speed")
     
+    # Per-phase timing hooks, None unless profiling was enabled
+    tracer = profiling.get_tracer("server")
+    
     try:
         while True:
+            if tracer: tracer.begin()
+            
             # Receive data from the client
             data, addr = sock.recvfrom(1024)  # Buffer size is 1024 bytes
+            if tracer: tracer.phase("recv")
             sender_ip, sender_port = addr  # Extract sender's IP
             
             # Extract SOME/IP header (16 bytes)
@@ -38,9 +45,11 @@ def run_server():
             
             # Parse the SOME/IP header
             header = parse_someip_header(someip_header_data)
+            if tracer: tracer.phase("parse")
             
             # Log the received message
             log_received_message(addr, header, payload)
+            if tracer: tracer.phase("log")
             
             # Determine which service and method to handle
             service_id = header['service_id']
@@ -82,16 +91,24 @@ def run_server():
                     session_id=session_id
                 )
                 response_type = "Error"
+            if tracer: tracer.phase("handle")  # Includes the control file I/O
             
             # Send the response back to the sender's IP on RESPONSE_PORT
             sock.sendto(someip_response, (sender_ip, RESPONSE_PORT))
+            if tracer: tracer.phase("send")
             
             # Log the response
             log_sent_response(sender_ip, RESPONSE_PORT, someip_response, response_type)
+            if tracer: tracer.phase("log")
             
     finally:
         # Close the socket
         sock.close()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="SOME/IP temperature server")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args)
     run_server()